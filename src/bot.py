@@ -2,16 +2,18 @@
 Telegram-бот для помощи абитуриентам ITMO
 """
 import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from src.database import ProgramDatabase
+from src.database import ProgramDatabase, MasterProgram
 from src.parser import ITMOMasterParser
 from src.recommender import CourseRecommender
 from src.dialog_system import DialogSystem
@@ -25,7 +27,10 @@ recommender = CourseRecommender(db)
 dialog_system = DialogSystem(db, recommender, use_openai=bool(os.getenv('OPENAI_API_KEY')))
 
 # Инициализация бота
-bot = Bot(token=os.getenv('TELEGRAM_BOT_TOKEN'))
+# Пул соединений с Telegram API шире стандартного (100) для пиковой нагрузки;
+# DNS aiogram уже кэширует на уровне TCPConnector
+session = AiohttpSession(limit=256, timeout=30)
+bot = Bot(token=os.getenv('TELEGRAM_BOT_TOKEN'), session=session)
 dp = Dispatcher(storage=MemoryStorage())
 
 
@@ -81,6 +86,35 @@ async def cmd_help(message: Message):
     await message.answer(help_text)
 
 
+# Кэш ответа /programs: (кортеж программ, текст, клавиатура).
+# get_all_programs возвращает новый кортеж после изменения каталога,
+# поэтому сравнение по идентичности служит признаком устаревания.
+_programs_menu_cache = None
+
+
+def _build_programs_menu(programs):
+    """Строит текст и клавиатуру со списком программ"""
+    global _programs_menu_cache
+    if _programs_menu_cache is not None and _programs_menu_cache[0] is programs:
+        return _programs_menu_cache[1], _programs_menu_cache[2]
+    
+    response = "📚 Доступные магистерские программы:\n\n"
+    buttons = []
+    
+    for i, prog in enumerate(programs, 1):
+        response += f"{i}. {prog.title}\n"
+        buttons.append([types.InlineKeyboardButton(
+            text=f"{prog.title}",
+            callback_data=f"prog:{prog.id}"
+        )])
+    
+    response += "\nНажмите на кнопку для подробностей или задайте вопрос."
+    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+    
+    _programs_menu_cache = (programs, response, keyboard)
+    return response, keyboard
+
+
 @dp.message(Command("programs"))
 async def cmd_programs(message: Message):
     """Показывает список доступных программ"""
@@ -90,17 +124,7 @@ async def cmd_programs(message: Message):
         await message.answer("❌ Данные о программах пока не загружены. Попробуйте позже.")
         return
     
-    response = "📚 Доступные магистерские программы:\n\n"
-    keyboard = types.InlineKeyboardMarkup()
-    
-    for i, prog in enumerate(programs, 1):
-        response += f"{i}. {prog.title}\n"
-        keyboard.add(types.InlineKeyboardButton(
-            text=f"{prog.title}",
-            callback_data=f"program_{prog.id}"
-        ))
-    
-    response += "\nНажмите на кнопку для подробностей или задайте вопрос."
+    response, keyboard = _build_programs_menu(programs)
     await message.answer(response, reply_markup=keyboard)
 
 
@@ -121,7 +145,12 @@ async def cmd_compare(message: Message):
 async def cmd_recommend(message: Message):
     """Показывает рекомендации"""
     user_id = message.from_user.id
-    profile = db.get_user_profile(user_id)
+    
+    # Профиль и список программ читаем параллельно, не блокируя event loop
+    profile, programs = await asyncio.gather(
+        asyncio.to_thread(db.get_user_profile, user_id),
+        asyncio.to_thread(db.get_all_programs)
+    )
     
     if not profile:
         await message.answer(
@@ -130,13 +159,14 @@ async def cmd_recommend(message: Message):
         )
         return
     
-    programs = db.get_all_programs()
     if not programs:
         await message.answer("❌ Данные о программах не загружены.")
         return
     
     # Рекомендуем программу
-    program_recommendations = recommender.recommend_program(user_id)
+    # Расчет рекомендаций (эмбеддинги, векторный поиск) выполняем в потоке,
+    # чтобы не блокировать обработку других апдейтов.
+    program_recommendations = await asyncio.to_thread(recommender.recommend_program, user_id)
     if program_recommendations:
         response = "🎯 Рекомендованные программы для вас:\n\n"
         for prog, score in program_recommendations:
@@ -161,8 +191,7 @@ async def cmd_clear(message: Message, state: FSMContext):
     """Очищает историю диалога"""
     await state.clear()
     # Сбрасываем контекст в диалоговой системе
-    if message.from_user.id in dialog_system.contexts:
-        del dialog_system.contexts[message.from_user.id]
+    dialog_system.clear_context(message.from_user.id)
     await message.answer("✅ История диалога очищена. Начните заново с команды /start")
 
 
@@ -208,8 +237,8 @@ async def process_goals(message: Message, state: FSMContext):
     data = await state.get_data()
     user_id = message.from_user.id
     
-    # Создаем профиль
-    recommender.create_user_profile(
+    # Создаем профиль (записи в MongoDB и векторную базу идут параллельно вне event loop)
+    await recommender.create_user_profile_async(
         user_id=user_id,
         background=[data.get('background', '')],
         interests=[data.get('interests', '')],
@@ -225,11 +254,10 @@ async def process_goals(message: Message, state: FSMContext):
     )
 
 
-# Обработчик callback-кнопок
-@dp.callback_query(F.data.startswith("program_"))
-async def callback_program(callback: CallbackQuery):
+# Обработчики callback-кнопок
+# callback_data имеет вид "<вид>:<program_id>", см. CALLBACK_HANDLERS
+async def callback_program(callback: CallbackQuery, program_id: str):
     """Обрабатывает нажатие на кнопку программы"""
-    program_id = callback.data.split("_")[1]
     program = db.get_program(program_id)
     
     if program:
@@ -240,15 +268,16 @@ async def callback_program(callback: CallbackQuery):
         summary = db.get_program_summary(program_id)
         
         # Добавляем кнопки действий
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(types.InlineKeyboardButton(
-            text="📖 Учебный план",
-            callback_data=f"plan_{program_id}"
-        ))
-        keyboard.add(types.InlineKeyboardButton(
-            text="⭐ Рекомендации по дисциплинам",
-            callback_data=f"recommend_courses_{program_id}"
-        ))
+        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+            [types.InlineKeyboardButton(
+                text="📖 Учебный план",
+                callback_data=f"plan:{program_id}"
+            )],
+            [types.InlineKeyboardButton(
+                text="⭐ Рекомендации по дисциплинам",
+                callback_data=f"rcc:{program_id}"
+            )]
+        ])
         
         await callback.message.edit_text(summary, reply_markup=keyboard)
     else:
@@ -257,30 +286,46 @@ async def callback_program(callback: CallbackQuery):
     await callback.answer()
 
 
-@dp.callback_query(F.data.startswith("plan_"))
-async def callback_plan(callback: CallbackQuery):
+async def callback_plan(callback: CallbackQuery, program_id: str):
     """Показывает учебный план"""
-    program_id = callback.data.split("_")[1]
     user_id = callback.from_user.id
     
-    plan = recommender.get_study_plan(user_id, program_id)
+    plan = await asyncio.to_thread(recommender.get_study_plan, user_id, program_id)
     await callback.message.edit_text(plan)
     await callback.answer()
 
 
-@dp.callback_query(F.data.startswith("recommend_courses_"))
-async def callback_recommend_courses(callback: CallbackQuery):
+async def callback_recommend_courses(callback: CallbackQuery, program_id: str):
     """Показывает рекомендации по дисциплинам"""
-    program_id = callback.data.split("_")[2]
     user_id = callback.from_user.id
     
-    recommendations = recommender.recommend_courses(user_id, program_id)
+    recommendations = await asyncio.to_thread(recommender.recommend_courses, user_id, program_id)
     response = recommender.format_recommendations(recommendations)
     
     await callback.message.edit_text(response)
     await callback.answer()
 
 
+CALLBACK_HANDLERS = {
+    "prog": callback_program,
+    "plan": callback_plan,
+    "rcc": callback_recommend_courses,
+}
+
+
+@dp.callback_query()
+async def handle_callback(callback: CallbackQuery):
+    """Направляет нажатие кнопки в обработчик по префиксу callback_data"""
+    kind, _, program_id = (callback.data or "").partition(":")
+    handler = CALLBACK_HANDLERS.get(kind)
+    
+    if handler is None:
+        await callback.answer()
+        return
+    
+    await handler(callback, program_id)
+
+
 # Обработчик текстовых сообщений
 @dp.message()
 async def handle_message(message: Message):
@@ -288,11 +333,30 @@ async def handle_message(message: Message):
     user_id = message.from_user.id
     text = message.text
     
-    # Передаем сообщение в диалоговую систему
-    response = dialog_system.process_message(user_id, text)
+    # Ответ LLM показываем по мере генерации: первое обновление отправляется
+    # новым сообщением, следующие редактируют его
+    reply = None
+    shown_text = None
+    
+    async def show_partial(partial: str):
+        nonlocal reply, shown_text
+        if not partial or partial == shown_text:
+            return
+        if reply is None:
+            reply = await message.answer(partial)
+        else:
+            await reply.edit_text(partial)
+        shown_text = partial
+    
+    # Передаем сообщение в диалоговую систему (запросы к LLM не блокируют
+    # обработку сообщений других пользователей)
+    response = await dialog_system.process_message(user_id, text, on_partial=show_partial)
     
     # Отправляем ответ
-    await message.answer(response)
+    if reply is None:
+        await message.answer(response)
+    elif response != shown_text:
+        await reply.edit_text(response)
 
 
 # Функция для парсинга данных
@@ -306,26 +370,18 @@ async def parse_programs():
     ]
     
     print("Начинаем парсинг данных...")
-    programs_data = parser.parse_all_programs(urls)
+    programs_data = await parser.parse_all_programs_async(urls)
     
     # Сохраняем в JSON
     parser.save_to_json(programs_data, "data/programs.json")
     
     # Обновляем базу данных
     for program_id, data in programs_data.items():
-        from src.database import MasterProgram, Course
-        courses = [Course(**c) for c in data.get('courses', [])]
-        program = MasterProgram(
-            id=program_id,
-            title=data.get('title', ''),
-            url=data.get('url', ''),
-            description=data.get('description', ''),
-            courses=courses,
-            requirements=data.get('requirements', []),
-            skills=data.get('skills', []),
-            career=data.get('career', [])
-        )
-        db.add_program(program)
+        if not data:
+            # Страницу не удалось разобрать - не затираем сохраненные данные
+            continue
+        db.add_program(MasterProgram.from_dict({**data, 'id': program_id}), defer_save=True)
+    db.save_programs()
     
     print(f"Парсинг завершен. Загружено {len(programs_data)} программ.")
 
@@ -337,10 +393,21 @@ async def main():
     # Парсим данные при запуске
     await parse_programs()
     
+    # Каталог может обновляться другими процессами - следим за изменениями
+    db.start_change_watcher()
+    
     # Запускаем бота
     print("Бот запущен!")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Сохраняем отложенные изменения профилей при остановке
+        db.close()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
     asyncio.run(main())
@@ -1,18 +1,85 @@
 """
 Модуль для работы с базой данных учебных планов (MongoDB)
 """
+import atexit
+import logging
 import os
-from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
-from pymongo import MongoClient
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterator, List, Optional, Sequence, Set, Tuple
+from dataclasses import dataclass, field
+from enum import IntEnum
+from pymongo import MongoClient, UpdateOne
+from pymongo.collation import Collation
 from pymongo.errors import ConnectionFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+# Регистронезависимое сравнение строк (strength=2 игнорирует регистр)
+CASE_INSENSITIVE = Collation(locale='ru', strength=2)
+
+# Проекция полного документа программы: служебные поля сервер не передает
+PROGRAM_PROJECTION = {'_id': 0, 'elective_courses': 0}
+
+# Длина n-грамм в индексе поиска дисциплин
+COURSE_NGRAM_SIZE = 3
+
+# Словарь навыков: (строка -> id, id -> строка, id программы -> набор id навыков)
+_SkillVocabulary = Tuple[Dict[str, int], List[str], Dict[str, FrozenSet[int]]]
+
+# Общие для процесса клиенты MongoDB (по строке подключения): у каждого клиента
+# собственный пул соединений, поэтому экземпляры ProgramDatabase их разделяют
+_client_cache: Dict[str, MongoClient] = {}
+_client_cache_lock = threading.Lock()
+
+
+def _get_client(mongodb_uri: str, **options) -> MongoClient:
+    """Возвращает общий клиент MongoDB для строки подключения"""
+    with _client_cache_lock:
+        client = _client_cache.get(mongodb_uri)
+        if client is None:
+            client = _client_cache[mongodb_uri] = MongoClient(mongodb_uri, **options)
+        return client
+
+
+def shutdown_clients():
+    """Закрывает все общие клиенты MongoDB (вызывается при завершении процесса)"""
+    with _client_cache_lock:
+        clients = list(_client_cache.values())
+        _client_cache.clear()
+    for client in clients:
+        client.close()
+    if clients:
+        logger.info("Соединение с MongoDB закрыто")
+
+
+atexit.register(shutdown_clients)
+
+
+class CourseType(IntEnum):
+    """Тип дисциплины"""
+    MANDATORY = 0
+    ELECTIVE = 1
+    OTHER = 2
+    
+    @classmethod
+    def from_str(cls, raw: str) -> 'CourseType':
+        """Определяет тип по строке из учебного плана"""
+        raw_lower = raw.lower()
+        if 'выборн' in raw_lower:
+            return cls.ELECTIVE
+        if 'обяз' in raw_lower:
+            return cls.MANDATORY
+        return cls.OTHER
+
+
+@dataclass(slots=True)
 class Course:
     """Класс для хранения информации о дисциплине"""
     name: str
@@ -21,22 +88,49 @@ class Course:
     semester: str
     description: str = ""
     skills: List[str] = None
+    type_enum: CourseType = field(init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if self.skills is None:
             self.skills = []
+        self.type_enum = CourseType.from_str(self.type)
+    
+    @property
+    def is_elective(self) -> bool:
+        """Является ли дисциплина выборной (тип разбирается один раз при создании)"""
+        return self.type_enum is CourseType.ELECTIVE
     
     def to_dict(self) -> Dict:
         """Преобразует объект в словарь для MongoDB"""
-        return asdict(self)
+        return {
+            'name': self.name,
+            'type': self.type,
+            'credits': self.credits,
+            'semester': self.semester,
+            'description': self.description,
+            'skills': list(self.skills)
+        }
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Course':
-        """Создает объект из словаря MongoDB"""
-        return cls(**data)
+        """
+        Создает объект из словаря MongoDB
+        
+        Поля заполняются напрямую, минуя __init__ и __post_init__:
+        метод вызывается для каждой дисциплины при каждом чтении каталога.
+        """
+        course = object.__new__(cls)
+        course.name = data.get('name', '')
+        course.type = data.get('type', '')
+        course.credits = data.get('credits', '')
+        course.semester = data.get('semester', '')
+        course.description = data.get('description', '')
+        course.skills = data.get('skills') or []
+        course.type_enum = CourseType.from_str(course.type)
+        return course
 
 
-@dataclass
+@dataclass(slots=True)
 class MasterProgram:
     """Класс для хранения информации о магистерской программе"""
     id: str
@@ -60,33 +154,70 @@ class MasterProgram:
     
     def to_dict(self) -> Dict:
         """Преобразует объект в словарь для MongoDB"""
-        data = asdict(self)
-        data['courses'] = [course.to_dict() for course in self.courses]
-        return data
+        return {
+            'id': self.id,
+            'title': self.title,
+            'url': self.url,
+            'description': self.description,
+            'courses': [course.to_dict() for course in self.courses],
+            'requirements': list(self.requirements),
+            'skills': list(self.skills),
+            'career': list(self.career)
+        }
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'MasterProgram':
-        """Создает объект из словаря MongoDB"""
-        courses = [Course.from_dict(c) for c in data.get('courses', [])]
-        return cls(
-            id=data.get('id', ''),
-            title=data.get('title', ''),
-            url=data.get('url', ''),
-            description=data.get('description', ''),
-            courses=courses,
-            requirements=data.get('requirements', []),
-            skills=data.get('skills', []),
-            career=data.get('career', [])
-        )
+        """Создает объект из словаря MongoDB (в обход __init__, см. Course.from_dict)"""
+        course_from_dict = Course.from_dict
+        program = object.__new__(cls)
+        program.id = data.get('id', '')
+        program.title = data.get('title', '')
+        program.url = data.get('url', '')
+        program.description = data.get('description', '')
+        program.courses = [course_from_dict(c) for c in data.get('courses') or ()]
+        program.requirements = data.get('requirements') or []
+        program.skills = data.get('skills') or []
+        program.career = data.get('career') or []
+        return program
 
 
 class ProgramDatabase:
     """База данных магистерских программ на MongoDB"""
     
+    # Задержка (в секундах) перед записью накопленных изменений профилей
+    PROFILE_FLUSH_DELAY = 1.5
+    
+    # Максимальное число профилей в LRU-кэше процесса
+    PROFILE_CACHE_SIZE = 1024
+    
+    # Профили не критичны к потере последней записи: не ждем журнала
+    PROFILE_WRITE_CONCERN = WriteConcern(w=1, j=False)
+    
+    # Задержка (в секундах) перечитывания каталога после изменения в MongoDB:
+    # события, пришедшие за это время, объединяются в одну перезагрузку
+    CATALOG_REFRESH_DELAY = 1.0
+    
+    # Размер пакета bulk_write (maxWriteBatchSize сервера)
+    BULK_WRITE_BATCH_SIZE = 1000
+    
+    # Параметры пула соединений, сжатия и таймаутов MongoClient
+    CLIENT_OPTIONS = {
+        'maxPoolSize': 50,
+        'minPoolSize': 5,
+        'compressors': 'zlib',
+        'serverSelectionTimeoutMS': 3000,
+        'connectTimeoutMS': 3000,
+        'socketTimeoutMS': 15000,
+        'retryWrites': True,
+        'retryReads': True
+    }
+    
     def __init__(self, mongodb_uri: str = None):
         """
         Инициализация подключения к MongoDB
         
+        Само подключение устанавливается при первом обращении к коллекциям.
+        
         Args:
             mongodb_uri: Строка подключения к MongoDB. Если не указана, берется из переменной окружения MONGODB_URI
         """
@@ -96,16 +227,84 @@ class ProgramDatabase:
         self.mongodb_uri = mongodb_uri
         self.client = None
         self.db = None
-        self.programs_collection = None
-        self.user_profiles_collection = None
+        self._programs_collection = None
+        self._user_profiles_collection = None
+        self._connect_lock = threading.Lock()
+        
+        # Каталог программ в памяти: загружается при подключении и
+        # перечитывается через refresh_cache() при изменениях
+        self._programs_cache: Optional[Tuple[MasterProgram, ...]] = None
+        self._program_cache: Dict[str, MasterProgram] = {}
+        self._refresh_lock = threading.Lock()
+        self.program_cache_hits = 0
+        self.program_cache_misses = 0
+        self._watcher_thread: Optional[threading.Thread] = None
+        self._refresh_timer: Optional[threading.Timer] = None
+        self._refresh_timer_lock = threading.Lock()
+        
+        # Индекс для поиска дисциплин: (название, описание) в нижнем регистре
+        # и инвертированный индекс n-грамма -> номера дисциплин в _course_index
+        self._course_index: Optional[List[Tuple[str, str, Course]]] = None
+        self._course_ngrams: Dict[str, Set[int]] = {}
+        
+        # Инвертированные индексы списочных полей (skills, career):
+        # значение в нижнем регистре -> id программ
+        self._field_indexes: Dict[str, Dict[str, Set[str]]] = {}
+        
+        # Кэши отформатированных описаний и сравнений программ
+        self._summary_cache: Dict[str, str] = {}
+        self._comparison_cache: Dict[Tuple[str, str], str] = {}
+        
+        # Словарь навыков: строка -> целочисленный id (и обратно),
+        # наборы навыков программ хранятся как frozenset id. Все три части
+        # сбрасываются одной заменой кортежа при смене каталога
+        self._skill_vocabulary: _SkillVocabulary = ({}, [], {})
+        
+        # Отложенные записи программ (сбрасываются в save_programs)
+        self._pending_programs: List[UpdateOne] = []
         
-        # Подключаемся к базе данных
-        self._connect()
+        # Отложенная запись профилей: изменения копятся и пишутся одним запросом
+        # (значения по умолчанию записываются только при создании профиля)
+        self._pending_profiles: Dict[int, Dict] = {}
+        self._pending_profile_defaults: Dict[int, Dict] = {}
+        self._profiles_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        
+        # Изменения, которые сейчас записываются в MongoDB: до подтверждения
+        # записи они накладываются на прочитанные профили, при ошибке
+        # возвращаются в очередь. Сбросы выполняются по одному
+        self._inflight_profiles: Dict[int, Dict] = {}
+        self._inflight_profile_defaults: Dict[int, Dict] = {}
+        self._flush_lock = threading.Lock()
+        
+        # LRU-кэш профилей активных пользователей
+        self._profile_cache: OrderedDict[int, Dict] = OrderedDict()
+    
+    @property
+    def programs_collection(self):
+        """Коллекция программ (подключается к MongoDB при первом обращении)"""
+        if self._programs_collection is None:
+            self._connect()
+        return self._programs_collection
+    
+    @property
+    def user_profiles_collection(self):
+        """Коллекция профилей (подключается к MongoDB при первом обращении)"""
+        if self._user_profiles_collection is None:
+            self._connect()
+        return self._user_profiles_collection
     
     def _connect(self):
         """Устанавливает соединение с MongoDB"""
+        with self._connect_lock:
+            if self._programs_collection is not None:
+                return
+            self._open_connection()
+    
+    def _open_connection(self):
+        """Подключается к MongoDB, получает коллекции и создает индексы"""
         try:
-            self.client = MongoClient(self.mongodb_uri)
+            self.client = _get_client(self.mongodb_uri, **self.CLIENT_OPTIONS)
             # Проверяем подключение
             self.client.admin.command('ping')
             
@@ -114,236 +313,772 @@ class ProgramDatabase:
             self.db = self.client[db_name]
             
             # Получаем коллекции
-            self.programs_collection = self.db['programs']
-            self.user_profiles_collection = self.db['user_profiles']
+            programs_collection = self.db['programs']
+            user_profiles_collection = self.db['user_profiles']
             
             # Создаем индексы для оптимизации запросов
-            self._create_indexes()
+            self._create_indexes(programs_collection, user_profiles_collection)
+            
+            self._user_profiles_collection = user_profiles_collection
+            self._programs_collection = programs_collection
             
-            print(f"Успешное подключение к MongoDB: {db_name}")
-        except ConnectionFailure as e:
-            print(f"Ошибка подключения к MongoDB: {e}")
+            # Каталог небольшой и почти не меняется - держим его в памяти
+            self.refresh_cache()
+            
+            logger.info("Успешное подключение к MongoDB: %s", db_name)
+        except ConnectionFailure:
+            logger.exception("Ошибка подключения к MongoDB")
             raise
-        except Exception as e:
-            print(f"Неожиданная ошибка при подключении к MongoDB: {e}")
+        except Exception:
+            logger.exception("Неожиданная ошибка при подключении к MongoDB")
             raise
     
-    def _create_indexes(self):
+    def _create_indexes(self, programs_collection, user_profiles_collection):
         """Создает индексы для оптимизации запросов"""
         try:
             # Индекс по id программы
-            self.programs_collection.create_index([('id', 1)], unique=True)
+            programs_collection.create_index([('id', 1)], unique=True)
+            
+            # Регистронезависимые индексы для поиска по навыкам и карьере
+            if 'skills_1' in programs_collection.index_information():
+                programs_collection.drop_index('skills_1')
+            programs_collection.create_index([('skills', 1)], name='skills_ci', collation=CASE_INSENSITIVE)
+            programs_collection.create_index([('career', 1)], name='career_ci', collation=CASE_INSENSITIVE)
             
-            # Индексы для поиска по навыкам и дисциплинам
-            self.programs_collection.create_index([('skills', 1)])
-            self.programs_collection.create_index([('courses.name', 'text')])
-            self.programs_collection.create_index([('courses.description', 'text')])
+            # MongoDB допускает только один текстовый индекс на коллекцию,
+            # поэтому название и описание дисциплин индексируются вместе
+            for name, info in programs_collection.index_information().items():
+                if name != 'courses_text' and any(kind == 'text' for _, kind in info['key']):
+                    programs_collection.drop_index(name)
+            programs_collection.create_index(
+                [('courses.name', 'text'), ('courses.description', 'text')],
+                name='courses_text'
+            )
             
             # Индекс по user_id для профилей пользователей
-            self.user_profiles_collection.create_index([('user_id', 1)], unique=True)
-        except PyMongoError as e:
-            print(f"Предупреждение: не удалось создать индексы: {e}")
+            user_profiles_collection.create_index([('user_id', 1)], unique=True)
+        except PyMongoError:
+            logger.warning("Не удалось создать индексы", exc_info=True)
+    
+    def _invalidate_derived_caches(self):
+        """Сбрасывает кэши, построенные по каталогу программ (вызывается под _refresh_lock)"""
+        self._course_index = None
+        self._course_ngrams = {}
+        self._field_indexes = {}
+        self._summary_cache.clear()
+        self._comparison_cache.clear()
+        self._skill_vocabulary = ({}, [], {})
+    
+    def refresh_cache(self) -> bool:
+        """
+        Перечитывает каталог программ из MongoDB в память
+        
+        Новый каталог собирается целиком и подменяет прежний, поэтому читатели
+        во время загрузки видят прежний каталог. При ошибке загрузки прежний
+        каталог и построенные по нему кэши остаются.
+        
+        Returns:
+            True, если каталог успешно загружен
+        """
+        return self._load_catalog(force=True)
+    
+    def _load_catalog(self, force: bool) -> bool:
+        """
+        Загружает каталог программ (загрузки выполняются по одной)
+        
+        Args:
+            force: Перечитать каталог, даже если он уже загружен
+            
+        Returns:
+            True, если каталог загружен
+        """
+        try:
+            # Подключаемся до захвата _refresh_lock: при подключении каталог
+            # загружается под _connect_lock, и порядок блокировок должен совпадать
+            self.programs_collection
+        except PyMongoError:
+            logger.exception("Ошибка при загрузке каталога программ")
+            return False
+        
+        with self._refresh_lock:
+            if not force and self._programs_cache is not None:
+                return True
+            try:
+                programs = tuple(self.iter_programs())
+            except PyMongoError:
+                logger.exception("Ошибка при загрузке каталога программ")
+                return False
+            
+            self._program_cache = {program.id: program for program in programs}
+            self._programs_cache = programs
+            self._invalidate_derived_caches()
+            return True
+    
+    def _replace_cached_program(self, program_id: str, program: Optional[MasterProgram]):
+        """
+        Обновляет одну программу в каталоге в памяти, не перечитывая MongoDB
+        
+        Args:
+            program_id: ID программы
+            program: Новая версия программы (None - программа удалена)
+        """
+        with self._refresh_lock:
+            programs = self._programs_cache
+            if programs is None:
+                # Каталог еще не загружен - он прочитается целиком при обращении
+                return
+            
+            updated = [p for p in programs if p.id != program_id]
+            if program is not None:
+                position = next((i for i, p in enumerate(programs) if p.id == program_id), len(updated))
+                updated.insert(position, program)
+            
+            self._program_cache = {p.id: p for p in updated}
+            self._programs_cache = tuple(updated)
+            self._invalidate_derived_caches()
+    
+    def _schedule_catalog_refresh(self):
+        """Перечитывает каталог через CATALOG_REFRESH_DELAY секунд (повторные вызовы объединяются)"""
+        with self._refresh_timer_lock:
+            if self._refresh_timer is None:
+                self._refresh_timer = threading.Timer(self.CATALOG_REFRESH_DELAY, self._run_scheduled_refresh)
+                self._refresh_timer.daemon = True
+                self._refresh_timer.start()
+    
+    def _run_scheduled_refresh(self):
+        """Выполняет отложенное перечитывание каталога"""
+        with self._refresh_timer_lock:
+            self._refresh_timer = None
+        self.refresh_cache()
+    
+    def start_change_watcher(self) -> bool:
+        """
+        Запускает фоновое отслеживание изменений коллекции программ
+        
+        Нужно, когда каталог изменяют другие процессы: изменения, пришедшие
+        в течение CATALOG_REFRESH_DELAY секунд, вызывают одно перечитывание
+        каталога. Требует replica set (change streams).
+        
+        Returns:
+            True, если поток отслеживания запущен
+        """
+        if self._watcher_thread is not None:
+            return True
+        
+        try:
+            stream = self.programs_collection.watch()
+        except PyMongoError:
+            logger.warning("Отслеживание изменений каталога недоступно", exc_info=True)
+            return False
+        
+        def watch():
+            try:
+                with stream:
+                    for _ in stream:
+                        self._schedule_catalog_refresh()
+            except PyMongoError:
+                logger.exception("Отслеживание изменений каталога остановлено")
+            finally:
+                self._watcher_thread = None
+        
+        self._watcher_thread = threading.Thread(target=watch, name='programs-watcher', daemon=True)
+        self._watcher_thread.start()
+        return True
     
     def close(self):
-        """Закрывает соединение с MongoDB"""
-        if self.client:
-            self.client.close()
-            print("Соединение с MongoDB закрыто")
+        """
+        Завершает работу с базой: записывает отложенные изменения профилей
+        
+        Клиент MongoDB общий для процесса и закрывается в shutdown_clients().
+        """
+        self.flush_user_profiles()
+    
+    @staticmethod
+    def _program_document(program: MasterProgram) -> Dict:
+        """
+        Формирует документ MongoDB для программы
+        
+        Кроме полей программы документ содержит денормализованный список
+        выборных дисциплин elective_courses для get_elective_courses.
+        """
+        data = program.to_dict()
+        data['elective_courses'] = [
+            course.to_dict() for course in program.courses
+            if course.is_elective
+        ]
+        return data
     
-    def add_program(self, program: MasterProgram):
-        """Добавляет программу в базу данных"""
+    def add_program(self, program: MasterProgram, defer_save: bool = False):
+        """
+        Добавляет программу в базу данных
+        
+        Args:
+            program: Магистерская программа
+            defer_save: Не записывать сразу, а накопить до вызова save_programs()
+        """
+        if defer_save:
+            self._pending_programs.append(
+                UpdateOne({'id': program.id}, {'$set': self._program_document(program)}, upsert=True)
+            )
+            return
+        
         try:
             self.programs_collection.update_one(
                 {'id': program.id},
-                {'$set': program.to_dict()},
+                {'$set': self._program_document(program)},
                 upsert=True
             )
-        except PyMongoError as e:
-            print(f"Ошибка при добавлении программы: {e}")
+        except PyMongoError:
+            logger.exception("Ошибка при добавлении программы")
+            raise
+        
+        # Копия, чтобы изменения переданного объекта не попадали в каталог
+        self._replace_cached_program(program.id, MasterProgram.from_dict(program.to_dict()))
+    
+    def add_programs_bulk(self, programs: List[MasterProgram]):
+        """
+        Добавляет несколько программ пакетными запросами
+        
+        Args:
+            programs: Список магистерских программ
+        """
+        for program in programs:
+            self.add_program(program, defer_save=True)
+        self.save_programs()
+    
+    def save_programs(self):
+        """Записывает накопленные программы пакетными запросами"""
+        if not self._pending_programs:
+            return
+        
+        try:
+            batch_size = self.BULK_WRITE_BATCH_SIZE
+            while self._pending_programs:
+                self.programs_collection.bulk_write(self._pending_programs[:batch_size], ordered=False)
+                del self._pending_programs[:batch_size]
+        except PyMongoError:
+            logger.exception("Ошибка при сохранении программ")
             raise
+        finally:
+            # При запущенном отслеживании изменений каталог перечитает watcher
+            # (события пакета объединяются в одну перезагрузку)
+            if self._watcher_thread is None:
+                self.refresh_cache()
     
     def get_program(self, program_id: str) -> Optional[MasterProgram]:
-        """Получает программу по ID"""
+        """Получает программу по ID (из каталога в памяти, при промахе - из MongoDB)"""
+        program = self._program_cache.get(program_id)
+        if program is not None:
+            self.program_cache_hits += 1
+            return program
+        
+        self.program_cache_misses += 1
         try:
-            data = self.programs_collection.find_one({'id': program_id})
-            if data:
-                data.pop('_id', None)  # Удаляем поле _id MongoDB
-                return MasterProgram.from_dict(data)
-            return None
-        except PyMongoError as e:
-            print(f"Ошибка при получении программы: {e}")
+            data = self.programs_collection.find_one({'id': program_id}, PROGRAM_PROJECTION)
+            if not data:
+                return None
+            program = MasterProgram.from_dict(data)
+        except PyMongoError:
+            logger.exception("Ошибка при получении программы")
             return None
+        
+        self._program_cache[program_id] = program
+        return program
     
-    def get_all_programs(self) -> List[MasterProgram]:
-        """Получает все программы"""
-        try:
-            programs = []
-            for data in self.programs_collection.find():
-                data.pop('_id', None)
-                programs.append(MasterProgram.from_dict(data))
-            return programs
-        except PyMongoError as e:
-            print(f"Ошибка при получении всех программ: {e}")
-            return []
+    def iter_programs(self, batch_size: int = 200) -> Iterator[MasterProgram]:
+        """
+        Последовательно читает программы из MongoDB, не накапливая их в памяти
+        
+        Args:
+            batch_size: Количество документов, получаемых за один запрос к серверу
+        """
+        for data in self.programs_collection.find({}, PROGRAM_PROJECTION).batch_size(batch_size):
+            yield MasterProgram.from_dict(data)
+    
+    def get_all_programs(self) -> Sequence[MasterProgram]:
+        """Получает все программы (из каталога в памяти)"""
+        programs = self._programs_cache
+        # Каталог загружает только один поток, остальные ждут его результата
+        if programs is None and self._load_catalog(force=False):
+            programs = self._programs_cache
+        return programs or ()
+    
+    @staticmethod
+    def _ngrams(text: str) -> Set[str]:
+        """Разбивает строку на n-граммы длины COURSE_NGRAM_SIZE"""
+        return {text[i:i + COURSE_NGRAM_SIZE] for i in range(len(text) - COURSE_NGRAM_SIZE + 1)}
+    
+    def _build_course_index(self) -> Tuple[List[Tuple[str, str, Course]], Dict[str, Set[int]]]:
+        """Строит индекс дисциплин по каталогу программ"""
+        programs = self.get_all_programs()
+        course_index = [
+            (course.name.lower(), course.description.lower(), course)
+            for program in programs
+            for course in program.courses
+        ]
+        course_ngrams: Dict[str, Set[int]] = {}
+        for position, (name, description, _) in enumerate(course_index):
+            for ngram in self._ngrams(name) | self._ngrams(description):
+                course_ngrams.setdefault(ngram, set()).add(position)
+        
+        # Индекс сохраняем только если каталог успешно прочитан и не сменился,
+        # пока индекс строился
+        if self._programs_cache is programs:
+            self._course_index = course_index
+            self._course_ngrams = course_ngrams
+        return course_index, course_ngrams
     
     def search_courses(self, query: str) -> List[Course]:
-        """Ищет дисциплины по запросу"""
-        try:
-            query_lower = query.lower()
-            results = []
-            
-            # Используем текстовый поиск MongoDB
-            for data in self.programs_collection.find({
-                '$or': [
-                    {'courses.name': {'$regex': query_lower, '$options': 'i'}},
-                    {'courses.description': {'$regex': query_lower, '$options': 'i'}}
-                ]
-            }):
-                data.pop('_id', None)
-                program = MasterProgram.from_dict(data)
-                for course in program.courses:
-                    if (query_lower in course.name.lower() or 
-                        query_lower in course.description.lower()):
-                        results.append(course)
-            
-            return results
-        except PyMongoError as e:
-            print(f"Ошибка при поиске дисциплин: {e}")
-            return []
+        """
+        Ищет дисциплины, в названии или описании которых встречается запрос
+        
+        Кандидаты отбираются пересечением списков n-грамм запроса,
+        затем вхождение подстроки проверяется явно.
+        """
+        course_index, course_ngrams = self._course_index, self._course_ngrams
+        if course_index is None:
+            course_index, course_ngrams = self._build_course_index()
+        
+        query_lower = query.lower()
+        query_ngrams = self._ngrams(query_lower)
+        if query_ngrams:
+            postings = sorted((course_ngrams.get(ngram, set()) for ngram in query_ngrams), key=len)
+            candidates = sorted(set.intersection(*postings))
+        else:
+            # Запрос короче n-граммы - проверяем все дисциплины
+            candidates = range(len(course_index))
+        
+        results = []
+        for position in candidates:
+            name, description, course = course_index[position]
+            if query_lower in name or query_lower in description:
+                results.append(course)
+        return results
     
     def get_elective_courses(self, program_id: str) -> List[Course]:
         """Получает выборные дисциплины программы"""
+        program = self._program_cache.get(program_id)
+        if program is not None:
+            return [c for c in program.courses if c.is_elective]
+        
         try:
-            data = self.programs_collection.find_one({'id': program_id})
+            # Для документов, записанных до появления поля elective_courses,
+            # выборные дисциплины отбирает сервер
+            data = self.programs_collection.find_one(
+                {'id': program_id},
+                {
+                    '_id': 0,
+                    'elective_courses': {'$ifNull': ['$elective_courses', {
+                        '$filter': {
+                            'input': {'$ifNull': ['$courses', []]},
+                            'cond': {'$regexMatch': {
+                                'input': '$$this.type',
+                                'regex': 'выборн',
+                                'options': 'i'
+                            }}
+                        }
+                    }]}
+                }
+            )
             if not data:
                 return []
-            
-            data.pop('_id', None)
-            program = MasterProgram.from_dict(data)
-            return [c for c in program.courses if 'выборн' in c.type.lower()]
-        except PyMongoError as e:
-            print(f"Ошибка при получении выборных дисциплин: {e}")
+            return [Course.from_dict(c) for c in data['elective_courses']]
+        except PyMongoError:
+            logger.exception("Ошибка при получении выборных дисциплин")
             return []
     
     def get_user_profile(self, user_id: int) -> Dict:
-        """Получает профиль пользователя"""
+        """Получает профиль пользователя (с учетом еще не записанных изменений)"""
+        with self._profiles_lock:
+            cached = self._profile_cache.get(user_id)
+            if cached is not None:
+                self._profile_cache.move_to_end(user_id)
+                return dict(cached)
+        
         try:
-            data = self.user_profiles_collection.find_one({'user_id': user_id})
-            if data:
-                data.pop('_id', None)
+            data = self.user_profiles_collection.find_one({'user_id': user_id}, {'_id': 0})
+        except PyMongoError:
+            logger.exception("Ошибка при получении профиля пользователя")
+            with self._profiles_lock:
+                data = dict(self._inflight_profiles.get(user_id, {}))
+                data.update(self._pending_profiles.get(user_id, {}))
                 return data
-            return {}
-        except PyMongoError as e:
-            print(f"Ошибка при получении профиля пользователя: {e}")
-            return {}
+        
+        with self._profiles_lock:
+            if data is None:
+                data = dict(self._inflight_profile_defaults.get(user_id, {}))
+                data.update(self._pending_profile_defaults.get(user_id, {}))
+            # Сначала изменения, которые еще пишутся, затем более новые
+            data.update(self._inflight_profiles.get(user_id, {}))
+            data.update(self._pending_profiles.get(user_id, {}))
+            self._cache_profile(user_id, data)
+        return dict(data)
+    
+    def _cache_profile(self, user_id: int, profile: Dict):
+        """Кладет профиль в LRU-кэш (вызывается под _profiles_lock)"""
+        self._profile_cache[user_id] = profile
+        self._profile_cache.move_to_end(user_id)
+        if len(self._profile_cache) > self.PROFILE_CACHE_SIZE:
+            self._profile_cache.popitem(last=False)
+    
+    def update_user_profile(self, user_id: int, updates: Dict, *, create_defaults: Dict = None):
+        """
+        Обновляет профиль пользователя
+        
+        Запись выполняется отложенно: изменения за PROFILE_FLUSH_DELAY секунд
+        объединяются и сохраняются одним запросом (см. flush_user_profiles).
+        
+        Args:
+            user_id: ID пользователя
+            updates: Только измененные поля профиля
+            create_defaults: Поля, которые записываются лишь при создании профиля
+        """
+        with self._profiles_lock:
+            self._pending_profiles.setdefault(user_id, {}).update(updates)
+            if create_defaults:
+                self._pending_profile_defaults.setdefault(user_id, {}).update(create_defaults)
+            cached = self._profile_cache.get(user_id)
+            if cached is not None:
+                cached.update(updates)
+                self._profile_cache.move_to_end(user_id)
+            self._schedule_profile_flush()
+    
+    def _schedule_profile_flush(self):
+        """Запускает таймер отложенной записи профилей (вызывается под _profiles_lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.PROFILE_FLUSH_DELAY, self.flush_user_profiles)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush_user_profiles(self):
+        """
+        Записывает накопленные изменения профилей в MongoDB
+        
+        При ошибке записи изменения возвращаются в очередь (не перекрывая
+        более новые) и запись повторяется через PROFILE_FLUSH_DELAY секунд.
+        """
+        with self._flush_lock:
+            self._flush_user_profiles()
     
-    def update_user_profile(self, user_id: int, profile: Dict):
-        """Обновляет профиль пользователя"""
+    def _flush_user_profiles(self):
+        """Одна попытка записи профилей (вызывается под _flush_lock)"""
+        with self._profiles_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            pending, self._pending_profiles = self._pending_profiles, {}
+            defaults, self._pending_profile_defaults = self._pending_profile_defaults, {}
+            self._inflight_profiles = pending
+            self._inflight_profile_defaults = defaults
+        
+        if not pending:
+            return
+        
+        operations = []
+        for user_id, updates in pending.items():
+            # $set и $setOnInsert не могут менять одно и то же поле
+            on_insert = {
+                key: value for key, value in defaults.get(user_id, {}).items()
+                if key not in updates
+            }
+            on_insert['user_id'] = user_id
+            update = {'$setOnInsert': on_insert}
+            if updates:
+                update['$set'] = updates
+            operations.append(UpdateOne({'user_id': user_id}, update, upsert=True))
+        
         try:
-            profile['user_id'] = user_id
-            self.user_profiles_collection.update_one(
-                {'user_id': user_id},
-                {'$set': profile},
-                upsert=True
-            )
-        except PyMongoError as e:
-            print(f"Ошибка при обновлении профиля пользователя: {e}")
-            raise
+            self.user_profiles_collection.with_options(
+                write_concern=self.PROFILE_WRITE_CONCERN
+            ).bulk_write(operations, ordered=False)
+        except PyMongoError:
+            logger.exception("Ошибка при обновлении профилей пользователей")
+            with self._profiles_lock:
+                # Изменения, сделанные во время записи, новее возвращаемых
+                for user_id, updates in pending.items():
+                    updates.update(self._pending_profiles.get(user_id, {}))
+                    self._pending_profiles[user_id] = updates
+                for user_id, user_defaults in defaults.items():
+                    user_defaults.update(self._pending_profile_defaults.get(user_id, {}))
+                    self._pending_profile_defaults[user_id] = user_defaults
+                self._inflight_profiles = {}
+                self._inflight_profile_defaults = {}
+                self._schedule_profile_flush()
+            return
+        
+        with self._profiles_lock:
+            self._inflight_profiles = {}
+            self._inflight_profile_defaults = {}
     
     def get_program_summary(self, program_id: str) -> str:
         """Получает краткое описание программы"""
-        program = self.get_program(program_id)
+        cached = self._summary_cache.get(program_id)
+        if cached is not None:
+            return cached
+        
+        cached_program = self._program_cache.get(program_id)
+        if cached_program is not None:
+            program = {
+                'title': cached_program.title,
+                'description': cached_program.description[:300],
+                'courses_count': len(cached_program.courses),
+                'skills': cached_program.skills[:5],
+                'career': cached_program.career[:3]
+            }
+        else:
+            program = self._fetch_summary_fields(program_id)
+        
         if not program:
             return "Программа не найдена"
         
-        summary = f"📚 {program.title}\n\n"
-        summary += f"📝 Описание: {program.description[:300]}...\n\n"
+        lines = [
+            f"📚 {program.get('title', '')}",
+            "",
+            f"📝 Описание: {program['description']}...",
+            ""
+        ]
         
-        if program.courses:
-            summary += f"📖 Дисциплин: {len(program.courses)}\n"
+        if program['courses_count']:
+            lines.append(f"📖 Дисциплин: {program['courses_count']}")
         
-        if program.skills:
-            summary += f"💡 Навыки: {', '.join(program.skills[:5])}\n"
+        if program.get('skills'):
+            lines.append(f"💡 Навыки: {', '.join(program['skills'])}")
         
-        if program.career:
-            summary += f"💼 Карьера: {', '.join(program.career[:3])}\n"
+        if program.get('career'):
+            lines.append(f"💼 Карьера: {', '.join(program['career'])}")
         
+        summary = "\n".join(lines) + "\n"
+        self._summary_cache[program_id] = summary
         return summary
     
+    def _fetch_summary_fields(self, program_id: str) -> Optional[Dict]:
+        """Читает из MongoDB только поля, нужные для описания программы"""
+        # Сервер возвращает усеченное описание, число дисциплин
+        # и первые навыки/направления карьеры
+        try:
+            return self.programs_collection.find_one(
+                {'id': program_id},
+                {
+                    '_id': 0,
+                    'title': 1,
+                    'description': {'$substrCP': [{'$ifNull': ['$description', '']}, 0, 300]},
+                    'courses_count': {'$size': {'$ifNull': ['$courses', []]}},
+                    'skills': {'$slice': 5},
+                    'career': {'$slice': 3}
+                }
+            )
+        except PyMongoError:
+            logger.exception("Ошибка при получении программы")
+            return None
+    
+    @staticmethod
+    def _get_skill_set(vocabulary: _SkillVocabulary,
+                       program_id: str, skills: List[str]) -> FrozenSet[int]:
+        """Возвращает набор id навыков программы в словаре навыков vocabulary"""
+        skill_ids, skill_names, skill_sets = vocabulary
+        skill_set = skill_sets.get(program_id)
+        if skill_set is None:
+            ids = []
+            for skill in skills:
+                skill_id = skill_ids.get(skill)
+                if skill_id is None:
+                    skill_id = skill_ids[skill] = len(skill_names)
+                    skill_names.append(skill)
+                ids.append(skill_id)
+            skill_set = skill_sets[program_id] = frozenset(ids)
+        return skill_set
+    
+    @staticmethod
+    def _skill_names_of(vocabulary: _SkillVocabulary,
+                        skill_ids: FrozenSet[int]) -> List[str]:
+        """Переводит id навыков обратно в строки"""
+        skill_names = vocabulary[1]
+        return [skill_names[skill_id] for skill_id in sorted(skill_ids)]
+    
     def compare_programs(self, program_id_1: str, program_id_2: str) -> str:
         """Сравнивает две программы"""
-        prog1 = self.get_program(program_id_1)
-        prog2 = self.get_program(program_id_2)
+        cache_key = (program_id_1, program_id_2)
+        cached = self._comparison_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        docs = {}
+        missing = []
+        for program_id in (program_id_1, program_id_2):
+            program = self._program_cache.get(program_id)
+            if program is None:
+                missing.append(program_id)
+            else:
+                docs[program_id] = {
+                    'title': program.title,
+                    'skills': program.skills,
+                    'courses_count': len(program.courses)
+                }
+        
+        # Отсутствующие в памяти программы читаем одним запросом,
+        # число дисциплин считает сервер
+        if missing:
+            try:
+                for doc in self.programs_collection.find(
+                    {'id': {'$in': missing}},
+                    {
+                        '_id': 0,
+                        'id': 1,
+                        'title': 1,
+                        'skills': 1,
+                        'courses_count': {'$size': {'$ifNull': ['$courses', []]}}
+                    }
+                ):
+                    docs[doc['id']] = doc
+            except PyMongoError:
+                logger.exception("Ошибка при сравнении программ")
+        
+        prog1 = docs.get(program_id_1)
+        prog2 = docs.get(program_id_2)
         
         if not prog1 or not prog2:
             return "Одна или обе программы не найдены"
         
-        comparison = f"🔍 Сравнение программ:\n\n"
-        comparison += f"📚 {prog1.title}\n"
-        comparison += f"📚 {prog2.title}\n\n"
+        title1 = prog1.get('title', '')
+        title2 = prog2.get('title', '')
         
-        # Сравнение количества дисциплин
-        comparison += f"📖 Дисциплин: {len(prog1.courses)} vs {len(prog2.courses)}\n"
+        lines = [
+            "🔍 Сравнение программ:",
+            "",
+            f"📚 {title1}",
+            f"📚 {title2}",
+            "",
+            # Сравнение количества дисциплин
+            f"📖 Дисциплин: {prog1['courses_count']} vs {prog2['courses_count']}"
+        ]
         
-        # Сравнение навыков
-        skills1 = set(prog1.skills)
-        skills2 = set(prog2.skills)
-        common = skills1 & skills2
-        unique1 = skills1 - skills2
-        unique2 = skills2 - skills1
+        # Сравнение навыков (словарь берется один раз: каталог может смениться
+        # во время сравнения)
+        vocabulary = self._skill_vocabulary
+        skills1 = self._get_skill_set(vocabulary, program_id_1, prog1.get('skills', []))
+        skills2 = self._get_skill_set(vocabulary, program_id_2, prog2.get('skills', []))
+        common = self._skill_names_of(vocabulary, skills1 & skills2)
+        unique1 = self._skill_names_of(vocabulary, skills1 - skills2)
+        unique2 = self._skill_names_of(vocabulary, skills2 - skills1)
         
         if common:
-            comparison += f"\n✅ Общие навыки: {', '.join(list(common)[:5])}\n"
+            lines.append("")
+            lines.append(f"✅ Общие навыки: {', '.join(common[:5])}")
         if unique1:
-            comparison += f"🔹 Только в {prog1.title}: {', '.join(list(unique1)[:3])}\n"
+            lines.append(f"🔹 Только в {title1}: {', '.join(unique1[:3])}")
         if unique2:
-            comparison += f"🔸 Только в {prog2.title}: {', '.join(list(unique2)[:3])}\n"
+            lines.append(f"🔸 Только в {title2}: {', '.join(unique2[:3])}")
         
+        comparison = "\n".join(lines) + "\n"
+        self._comparison_cache[cache_key] = comparison
         return comparison
     
-    def search_programs_by_skill(self, skill: str) -> List[MasterProgram]:
-        """Ищет программы по навыку"""
-        try:
-            programs = []
-            for data in self.programs_collection.find({'skills': {'$regex': skill, '$options': 'i'}}):
-                data.pop('_id', None)
-                programs.append(MasterProgram.from_dict(data))
-            return programs
-        except PyMongoError as e:
-            print(f"Ошибка при поиске программ по навыку: {e}")
-            return []
+    def search_programs_by_skill(self, skill: str, prefix: bool = False) -> List[MasterProgram]:
+        """
+        Ищет программы по навыку
+        
+        Args:
+            skill: Навык. По умолчанию ищется точное совпадение без учета регистра
+                (использует индекс skills_ci)
+            prefix: Искать навыки, начинающиеся с указанной строки
+            
+        Returns:
+            Список найденных программ
+        """
+        return self._search_programs_by_field('skills', skill, prefix)
     
-    def search_programs_by_career(self, career: str) -> List[MasterProgram]:
-        """Ищет программы по карьерному направлению"""
+    def search_programs_by_career(self, career: str, prefix: bool = False) -> List[MasterProgram]:
+        """
+        Ищет программы по карьерному направлению
+        
+        Args:
+            career: Карьерное направление. По умолчанию ищется точное совпадение
+                без учета регистра (использует индекс career_ci)
+            prefix: Искать направления, начинающиеся с указанной строки
+            
+        Returns:
+            Список найденных программ
+        """
+        return self._search_programs_by_field('career', career, prefix)
+    
+    def _get_field_index(self, field_name: str) -> Optional[Dict[str, Set[str]]]:
+        """Возвращает инвертированный индекс списочного поля (None, если каталог не загружен)"""
+        field_index = self._field_indexes.get(field_name)
+        if field_index is None:
+            programs = self.get_all_programs()
+            if self._programs_cache is None:
+                return None
+            field_index = {}
+            for program in programs:
+                for value in getattr(program, field_name):
+                    field_index.setdefault(value.lower(), set()).add(program.id)
+            # Не сохраняем индекс, если каталог сменился, пока индекс строился
+            if self._programs_cache is programs:
+                self._field_indexes[field_name] = field_index
+        return field_index
+    
+    def _search_programs_by_field(self, field_name: str, value: str, prefix: bool) -> List[MasterProgram]:
+        """Ищет программы по значению элемента списочного поля"""
+        field_index = self._get_field_index(field_name)
+        if field_index is not None:
+            value_lower = value.lower()
+            if prefix:
+                program_ids = set()
+                for key, ids in field_index.items():
+                    if key.startswith(value_lower):
+                        program_ids |= ids
+            else:
+                program_ids = field_index.get(value_lower, set())
+            return [program for program in self._programs_cache or () if program.id in program_ids]
+        
         try:
-            programs = []
-            for data in self.programs_collection.find({'career': {'$regex': career, '$options': 'i'}}):
-                data.pop('_id', None)
-                programs.append(MasterProgram.from_dict(data))
-            return programs
-        except PyMongoError as e:
-            print(f"Ошибка при поиске программ по карьере: {e}")
+            if prefix:
+                cursor = self.programs_collection.find(
+                    {field_name: {'$regex': '^' + re.escape(value), '$options': 'i'}},
+                    PROGRAM_PROJECTION
+                )
+            else:
+                cursor = self.programs_collection.find(
+                    {field_name: value}, PROGRAM_PROJECTION, collation=CASE_INSENSITIVE
+                )
+            
+            return [MasterProgram.from_dict(data) for data in cursor]
+        except PyMongoError:
+            logger.exception("Ошибка при поиске программ по полю %s", field_name)
             return []
     
     def delete_program(self, program_id: str) -> bool:
         """Удаляет программу из базы данных"""
         try:
             result = self.programs_collection.delete_one({'id': program_id})
-            return result.deleted_count > 0
-        except PyMongoError as e:
-            print(f"Ошибка при удалении программы: {e}")
+        except PyMongoError:
+            logger.exception("Ошибка при удалении программы")
             return False
+        
+        if result.deleted_count:
+            self._replace_cached_program(program_id, None)
+        return result.deleted_count > 0
     
     def get_programs_count(self) -> int:
-        """Возвращает количество программ в базе данных"""
+        """Возвращает количество программ в базе данных (оценка по метаданным коллекции)"""
+        try:
+            return self.programs_collection.estimated_document_count()
+        except PyMongoError:
+            logger.exception("Ошибка при подсчете программ")
+            return 0
+    
+    def get_programs_count_exact(self) -> int:
+        """Возвращает точное количество программ в базе данных"""
         try:
             return self.programs_collection.count_documents({})
-        except PyMongoError as e:
-            print(f"Ошибка при подсчете программ: {e}")
+        except PyMongoError:
+            logger.exception("Ошибка при подсчете программ")
             return 0
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # Тестирование базы данных
     db = ProgramDatabase()
     
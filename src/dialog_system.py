@@ -1,99 +1,173 @@
 """
 Модуль диалоговой системы с фильтрацией релевантных вопросов
 """
+import asyncio
+import logging
 import re
-from typing import List, Dict, Optional, Tuple
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, ClassVar, Deque, Dict, Optional, Sequence, Tuple
 from dataclasses import dataclass
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from pydantic import BaseModel
 import os
 
+logger = logging.getLogger(__name__)
 
-class RelevanceCheck(BaseModel):
-    """Модель для структурированного ответа от OpenAI"""
+
+def _compile_keywords(keywords: Sequence[str]) -> re.Pattern:
+    """Собирает ключевые слова в одно регулярное выражение (поиск за один проход)"""
+    return re.compile("|".join(map(re.escape, keywords)))
+
+
+# Основы слов, связанные с обучением в магистратуре. Кортежи неизменяемы,
+# поэтому не расходятся со скомпилированными из них выражениями; основы,
+# которые уже покрыты более короткими ("программист" - "программ"), не повторяются
+_EDUCATION_KEYWORDS = (
+    'магистратур', 'программ', 'обучени', 'учебн', 'дисциплин', 'курс',
+    'предмет', 'экзамен', 'зачет', 'семестр', 'лекци', 'практик',
+    'поступлени', 'абитуриент', 'конкурс', 'балл', 'документ',
+    'диплом', 'аттестат', 'специальност', 'направлени', 'професси',
+    'карьер', 'трудоустройств', 'навык', 'компетенци', 'знани',
+    'итмо', 'университет', 'факультет', 'кафедр', 'преподавател',
+    'обязательн', 'электив', 'модул', 'блок', 'план',
+    'ai', 'искусственн', 'интеллект', 'машинн', 'ml',
+    'data', 'science', 'аналитик', 'разработчик',
+    'проект', 'исследован', 'научн', 'стажировк',
+    'грант', 'стипенди', 'оплата', 'бюджет', 'контракт',
+    'рекомендац', 'совет', 'выбор', 'подход',
+)
+
+# Основы слов для неактуальных тем
+_IRRELEVANT_KEYWORDS = (
+    'погод', 'новост', 'спорт', 'футбол', 'музык', 'фильм', 'кино',
+    'игр', 'анекдот', 'шутк', 'рецепт', 'готовк', 'кухн',
+    'политик', 'религи', 'медицин', 'болезн', 'лекарств',
+    'автомобил', 'машин', 'ремонт', 'строительств', 'недвижимост',
+    'криптовалют', 'биткоин', 'инвест', 'акци', 'бирж',
+    'знакомств', 'отношени', 'любов', 'семь', 'дет',
+)
+
+
+# Обработчик промежуточного текста ответа при потоковой генерации
+PartialCallback = Callable[[str], Awaitable[None]]
+
+
+# Общий клиент OpenAI процесса (один пул соединений с keep-alive)
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> Optional[AsyncOpenAI]:
+    """
+    Возвращает общий клиент OpenAI, создавая его при первом вызове
+    
+    Returns:
+        Клиент OpenAI или None, если не задан OPENAI_API_KEY
+    """
+    global _openai_client
+    if _openai_client is None:
+        api_key = os.getenv('OPENAI_API_KEY')
+        if api_key:
+            _openai_client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(
+                    timeout=30.0,
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+                )
+            )
+    return _openai_client
+
+
+class CombinedTurn(BaseModel):
+    """Модель структурированного ответа OpenAI: проверка релевантности и ответ за один вызов"""
     is_relevant: bool
     reason: str
+    answer: str = ""
 
 
 @dataclass
 class DialogContext:
     """Контекст диалога с пользователем"""
+    MAX_QUESTIONS: ClassVar[int] = 8
+    
     user_id: int
     current_program: Optional[str] = None
-    questions_asked: List[str] = None
+    questions_asked: Deque[str] = None  # последние MAX_QUESTIONS вопросов
     stage: str = "greeting"  # greeting, profile, recommendation, chat
+    last_active: float = 0.0  # time.monotonic() последнего обращения
     
     def __post_init__(self):
         if self.questions_asked is None:
-            self.questions_asked = []
+            self.questions_asked = deque(maxlen=self.MAX_QUESTIONS)
 
 
 class RelevanceFilter:
     """Фильтр релевантности вопросов"""
     
     # Ключевые слова, связанные с обучением в магистратуре
-    EDUCATION_KEYWORDS = [
-        'магистратур', 'программ', 'обучени', 'учебн', 'дисциплин', 'курс',
-        'предмет', 'экзамен', 'зачет', 'семестр', 'лекци', 'практик',
-        'поступлени', 'абитуриент', 'конкурс', 'балл', 'документ',
-        'диплом', 'аттестат', 'специальност', 'направлени', 'професси',
-        'карьер', 'трудоустройств', 'навык', 'компетенци', 'знани',
-        'итмо', 'университет', 'факультет', 'кафедр', 'преподавател',
-        'выборн', 'обязательн', 'электив', 'модул', 'блок', 'план',
-        'ai', 'искусственн', 'интеллект', 'машинн', 'обучени', 'ml',
-        'data', 'science', 'аналитик', 'разработчик', 'программист',
-        'проект', 'исследован', 'научн', 'практика', 'стажировк',
-        'грант', 'стипенди', 'оплата', 'бюджет', 'контракт',
-        'рекомендац', 'совет', 'выбор', 'подход', 'подходит'
-    ]
+    EDUCATION_KEYWORDS = _EDUCATION_KEYWORDS
     
     # Ключевые слова для неактуальных тем
-    IRRELEVANT_KEYWORDS = [
-        'погод', 'новост', 'спорт', 'футбол', 'музык', 'фильм', 'кино',
-        'игр', 'анекдот', 'шутк', 'рецепт', 'готовк', 'кухн',
-        'политик', 'религи', 'медицин', 'болезн', 'лекарств',
-        'автомобил', 'машин', 'ремонт', 'строительств', 'недвижимост',
-        'криптовалют', 'биткоин', 'инвест', 'акци', 'бирж',
-        'знакомств', 'отношени', 'любов', 'семь', 'дет'
-    ]
+    IRRELEVANT_KEYWORDS = _IRRELEVANT_KEYWORDS
     
-    def __init__(self, use_openai: bool = False):
-        self.use_openai = use_openai
-        self.client = None
-        if use_openai:
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                self.client = OpenAI(api_key=api_key)
+    # Ключевые слова намерений в порядке приоритета
+    INTENT_KEYWORDS = {
+        'compare': ['сравн', 'разниц', 'отлич', 'лучш', 'против'],
+        'recommend': ['посовет', 'рекоменд', 'как выбрать', 'что выбрать'],
+        'search': ['где', 'как', 'когда', 'сколько', 'какой', 'какие'],
+        'info': ['расскаж', 'что', 'кто', 'почему', 'зачем'],
+    }
     
-    def is_relevant(self, question: str, context: Optional[DialogContext] = None) -> Tuple[bool, str]:
+    # Списки ключевых слов компилируются один раз при импорте
+    _IRRELEVANT_RE = _compile_keywords(IRRELEVANT_KEYWORDS)
+    _EDUCATION_RE = _compile_keywords(EDUCATION_KEYWORDS)
+    
+    # Все намерения - одно выражение с именованными группами
+    _INTENT_RE = re.compile("|".join(
+        f"(?P<{intent}>{'|'.join(map(re.escape, keywords))})"
+        for intent, keywords in INTENT_KEYWORDS.items()
+    ))
+    _INTENT_PRIORITY = {intent: priority for priority, intent in enumerate(INTENT_KEYWORDS)}
+    
+    def check_keywords(self, question: str) -> Optional[Tuple[bool, str]]:
         """
-        Проверяет, является ли вопрос релевантным теме магистратуры
+        Быстрая проверка релевантности по ключевым словам
         
-        Args:
-            question: Вопрос пользователя
-            context: Контекст диалога
-            
         Returns:
-            Кортеж (является_релевантным, причина)
+            Кортеж (является_релевантным, причина) или None, если ключевых слов нет
         """
         question_lower = question.lower()
         
         # Проверяем на явно нерелевантные темы
-        for keyword in self.IRRELEVANT_KEYWORDS:
-            if keyword in question_lower:
-                return False, f"Вопрос относится к теме '{keyword}', которая не связана с обучением в магистратуре"
+        match = self._IRRELEVANT_RE.search(question_lower)
+        if match:
+            return False, f"Вопрос относится к теме '{match.group()}', которая не связана с обучением в магистратуре"
         
         # Проверяем на релевантные ключевые слова
-        education_matches = sum(1 for kw in self.EDUCATION_KEYWORDS if kw in question_lower)
-        
-        if education_matches >= 1:
+        if self._EDUCATION_RE.search(question_lower):
             return True, "Вопрос связан с обучением в магистратуре"
         
-        # Если используем OpenAI для более точной проверки
-        if self.use_openai and self.client:
-            return self._check_with_openai(question, context)
+        return None
+    
+    def is_relevant(self, question: str, context: Optional[DialogContext] = None) -> Tuple[bool, str]:
+        """
+        Проверяет, является ли вопрос релевантным теме магистратуры
         
-        # Если нет явных ключевых слов, проверяем контекст
+        Args:
+            question: Вопрос пользователя
+            context: Контекст диалога
+            
+        Returns:
+            Кортеж (является_релевантным, причина)
+        """
+        verdict = self.check_keywords(question)
+        if verdict is not None:
+            return verdict
+        return self.check_context(question, context)
+    
+    def check_context(self, question: str, context: Optional[DialogContext] = None) -> Tuple[bool, str]:
+        """Проверяет релевантность вопроса без ключевых слов по контексту диалога"""
         if context and context.current_program:
             # Если пользователь уже в контексте программы, считаем вопрос релевантным
             return True, "Вопрос в контексте обсуждения программы"
@@ -104,38 +178,6 @@ class RelevanceFilter:
         
         return False, "Вопрос не содержит ключевых слов, связанных с обучением в магистратуре"
     
-    def _check_with_openai(self, question: str, context: Optional[DialogContext] = None) -> Tuple[bool, str]:
-        """Использует OpenAI для проверки релевантности с structured_output"""
-        try:
-            system_prompt = """Ты - фильтр релевантности для чат-бота о магистратуре ITMO.
-Твоя задача - определить, относится ли вопрос к теме обучения в магистратуре ITMO.
-
-Релевантные темы: магистерские программы, дисциплины, поступление, обучение, карьера, навыки.
-Нерелевантные темы: погода, спорт, политика, развлечения, личные отношения."""
-
-            context_info = ""
-            if context and context.current_program:
-                context_info = f"\nКонтекст: пользователь обсуждает программу {context.current_program}"
-            
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Вопрос: {question}{context_info}"}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0
-            )
-            
-            result = response.choices[0].message.content
-            relevance_check = RelevanceCheck.model_validate_json(result)
-            
-            return relevance_check.is_relevant, relevance_check.reason
-                
-        except Exception as e:
-            # При ошибке возвращаем False для безопасности
-            return False, f"Ошибка проверки: {str(e)}"
-    
     def extract_intent(self, question: str) -> str:
         """
         Извлекает намерение пользователя из вопроса
@@ -143,44 +185,70 @@ class RelevanceFilter:
         Returns:
             Тип намерения: info, compare, recommend, search, other
         """
-        question_lower = question.lower()
-        
-        # Сравнение программ
-        if any(kw in question_lower for kw in ['сравн', 'разниц', 'отлич', 'лучш', 'против']):
-            return 'compare'
-        
-        # Рекомендации
-        if any(kw in kw in question_lower for kw in ['посовет', 'рекоменд', 'как выбрать', 'что выбрать']):
-            return 'recommend'
-        
-        # Поиск информации
-        if any(kw in question_lower for kw in ['где', 'как', 'когда', 'сколько', 'какой', 'какие']):
-            return 'search'
-        
-        # Общая информация
-        if any(kw in question_lower for kw in ['расскаж', 'что', 'кто', 'почему', 'зачем']):
-            return 'info'
-        
-        return 'other'
+        # Один проход по сообщению; при нескольких совпадениях
+        # выбирается намерение с наивысшим приоритетом
+        intent = 'other'
+        best_priority = len(self._INTENT_PRIORITY)
+        for match in self._INTENT_RE.finditer(question.lower()):
+            priority = self._INTENT_PRIORITY[match.lastgroup]
+            if priority < best_priority:
+                intent, best_priority = match.lastgroup, priority
+                if priority == 0:
+                    break
+        
+        return intent
 
 
 class DialogSystem:
     """Диалоговая система для общения с абитуриентами"""
     
-    def __init__(self, db, recommender, use_openai: bool = False):
+    # Максимальное число хранимых контекстов (вытесняются давно неактивные)
+    MAX_CONTEXTS = 10000
+    
+    # Время жизни контекста без активности, в секундах
+    CONTEXT_TTL = 3600
+    
+    # Лимит токенов ответа ассистента (промпт просит уложиться в 200 слов)
+    ANSWER_MAX_TOKENS = 220
+    
+    # Лимит токенов проверки релевантности без ответа (JSON с краткой причиной)
+    VERDICT_MAX_TOKENS = 60
+    
+    # Стадии, в которых ответ LLM может понадобиться (обработчик передает
+    # сообщение в свободный чат); в остальных запрашивается только вердикт
+    ANSWER_STAGES = frozenset({"recommendation", "chat"})
+    
+    # Минимальный интервал (в секундах) между промежуточными обновлениями ответа
+    STREAM_UPDATE_INTERVAL = 0.4
+    
+    # Кэш ответов LLM на повторяющиеся вопросы: размер и время жизни (в секундах)
+    RESPONSE_CACHE_SIZE = 10000
+    RESPONSE_CACHE_TTL = 3600
+    
+    def __init__(self, db, recommender, use_openai: bool = False,
+                 client: Optional[AsyncOpenAI] = None):
         self.db = db
         self.recommender = recommender
-        self.relevance_filter = RelevanceFilter(use_openai=use_openai)
-        self.contexts: Dict[int, DialogContext] = {}
+        self.relevance_filter = RelevanceFilter()
+        self.contexts: OrderedDict[int, DialogContext] = OrderedDict()
         self.use_openai = use_openai
         self.client = None
         if use_openai:
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                self.client = OpenAI(api_key=api_key)
+            self.client = client or get_openai_client()
         
         # Загружаем ответы на типовые вопросы
         self.faq_answers = self._load_faq()
+        self._faq_re = _compile_keywords(list(self.faq_answers))
+        
+        # Кэш описания программ для промпта: (кортеж программ, текст).
+        # get_all_programs возвращает новый кортеж после изменения каталога
+        self._programs_info_cache: Optional[Tuple[Sequence, str]] = None
+        
+        # Поиск упоминаний программ: (кортеж программ, выражение, ключ -> id программы)
+        self._program_lookup: Optional[Tuple[Sequence, re.Pattern, Dict[str, str]]] = None
+        
+        # Кэш ответов LLM: ключ -> (время сохранения, ответ)
+        self._response_cache: OrderedDict[Tuple, Tuple[float, object]] = OrderedDict()
     
     def _load_faq(self) -> Dict[str, str]:
         """Загружает ответы на типовые вопросы"""
@@ -207,33 +275,75 @@ class DialogSystem:
     
     def get_or_create_context(self, user_id: int) -> DialogContext:
         """Получает или создает контекст диалога"""
-        if user_id not in self.contexts:
-            self.contexts[user_id] = DialogContext(user_id=user_id)
-        return self.contexts[user_id]
+        now = time.monotonic()
+        context = self.contexts.get(user_id)
+        
+        # Истекший контекст начинаем заново
+        if context is None or now - context.last_active > self.CONTEXT_TTL:
+            context = DialogContext(user_id=user_id)
+            self.contexts[user_id] = context
+        
+        context.last_active = now
+        self.contexts.move_to_end(user_id)
+        
+        # Вытесняем истекшие и самые давно неактивные контексты
+        self.expire_contexts(now)
+        while len(self.contexts) > self.MAX_CONTEXTS:
+            self.contexts.popitem(last=False)
+        
+        return context
     
-    def _generate_llm_response(self, question: str, context: DialogContext) -> Optional[str]:
+    def expire_contexts(self, now: Optional[float] = None) -> int:
         """
-        Генерирует ответ с помощью LLM
+        Удаляет контексты, неактивные дольше CONTEXT_TTL
+        
+        Контексты упорядочены по времени последнего обращения, поэтому
+        просматриваются только истекшие записи в начале словаря.
         
-        Args:
-            question: Вопрос пользователя
-            context: Контекст диалога
-            
         Returns:
-            Сгенерированный ответ или None при ошибке
+            Количество удаленных контекстов
         """
-        if not self.use_openai or not self.client:
-            return None
+        if now is None:
+            now = time.monotonic()
+        
+        removed = 0
+        while self.contexts:
+            oldest = next(iter(self.contexts.values()))
+            if now - oldest.last_active <= self.CONTEXT_TTL:
+                break
+            self.contexts.popitem(last=False)
+            removed += 1
+        return removed
+    
+    def _find_program(self, message_lower: str) -> Optional[str]:
+        """
+        Ищет в сообщении название или id программы
         
-        try:
-            # Собираем информацию о программах для контекста
-            programs_info = ""
-            programs = self.db.get_all_programs()
-            if programs:
-                programs_info = "\n".join([f"- {p.title}: {p.description[:100]}..." for p in programs])
-            
-            # Формируем системный промпт
-            system_prompt = """Ты - полезный ассистент для абитуриентов магистратуры ITMO.
+        Returns:
+            ID упомянутой программы или None
+        """
+        programs = self.db.get_all_programs()
+        lookup = self._program_lookup
+        if lookup is None or lookup[0] is not programs:
+            keys = {}
+            for prog in programs:
+                keys.setdefault(prog.title.lower(), prog.id)
+                keys.setdefault(prog.id, prog.id)
+            # Длинные ключи раньше коротких: "ai_product" не должен совпасть как "ai"
+            pattern = re.compile("|".join(
+                map(re.escape, sorted((key for key in keys if key), key=len, reverse=True))
+            ) or r"(?!)")
+            lookup = self._program_lookup = (programs, pattern, keys)
+        
+        match = lookup[1].search(message_lower)
+        return lookup[2][match.group()] if match else None
+    
+    def clear_context(self, user_id: int) -> None:
+        """Удаляет контекст диалога пользователя"""
+        self.contexts.pop(user_id, None)
+    
+    # Системный промпт ассистента
+    ASSISTANT_PROMPT = """Ты - полезный ассистент для абитуриентов магистратуры ITMO.
 Твоя задача - отвечать на вопросы о магистерских программах, дисциплинах, поступлении и обучении.
 
 Правила:
@@ -242,41 +352,187 @@ class DialogSystem:
 3. Если не знаешь точного ответа, предложи обратиться на сайт abit.itmo.ru
 4. Используй предоставленную информацию о программах
 5. Отвечай кратко и по существу (до 200 слов)"""
+    
+    # Дополнение промпта для совмещенной проверки релевантности и ответа
+    COMBINED_PROMPT = ASSISTANT_PROMPT + """
+
+Сначала определи, относится ли вопрос к теме обучения в магистратуре ITMO.
+Релевантные темы: магистерские программы, дисциплины, поступление, обучение, карьера, навыки.
+Нерелевантные темы: погода, спорт, политика, развлечения, личные отношения.
+
+Ответ верни в формате JSON: {"is_relevant": true/false, "reason": "краткая причина",
+"answer": "ответ пользователю (пустая строка, если вопрос нерелевантен)"}"""
+    
+    # Промпт проверки релевантности без генерации ответа
+    VERDICT_PROMPT = """Ты проверяешь сообщения абитуриентов магистратуры ITMO.
+Определи, относится ли сообщение к теме обучения в магистратуре ITMO с учетом контекста диалога.
+Релевантные темы: магистерские программы, дисциплины, поступление, обучение, карьера, навыки,
+а также ответы пользователя о своем образовании, навыках, интересах и целях.
+Нерелевантные темы: погода, спорт, политика, развлечения, личные отношения.
 
-            # Формируем контекст для LLM
-            context_info = f"""
+Ответ верни в формате JSON: {"is_relevant": true/false, "reason": "краткая причина"}"""
+    
+    def _build_llm_context(self, context: DialogContext) -> str:
+        """Формирует описание контекста диалога и программ для LLM"""
+        programs = self.db.get_all_programs()
+        cached = self._programs_info_cache
+        if cached is None or cached[0] is not programs:
+            cached = self._programs_info_cache = (
+                programs,
+                "\n".join(f"- {p.title}: {p.description[:100]}..." for p in programs)
+            )
+        programs_info = cached[1]
+        
+        return f"""
 Контекст диалога:
 - Стадия: {context.stage}
 - Текущая программа: {context.current_program or 'не выбрана'}
-- Заданные вопросы: {', '.join(context.questions_asked[-3:]) if context.questions_asked else 'нет'}
+- Заданные вопросы: {', '.join(list(context.questions_asked)[-3:]) if context.questions_asked else 'нет'}
 
 Доступные программы:
 {programs_info}
 """
+    
+    async def _generate_llm_response(self, question: str, context: DialogContext,
+                                     on_partial: Optional[PartialCallback] = None) -> Optional[str]:
+        """
+        Генерирует ответ с помощью LLM
+        
+        Ответ генерируется потоково: накопленный текст передается в on_partial
+        не чаще раза в STREAM_UPDATE_INTERVAL секунд.
+        
+        Args:
+            question: Вопрос пользователя
+            context: Контекст диалога
+            on_partial: Обработчик промежуточного текста ответа
             
-            response = self.client.chat.completions.create(
+        Returns:
+            Сгенерированный ответ или None при ошибке
+        """
+        if not self.use_openai or not self.client:
+            return None
+        
+        cache_key = self._response_key('answer', question, context)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self.client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"{context_info}\n\nВопрос пользователя: {question}"}
+                    {"role": "system", "content": self.ASSISTANT_PROMPT},
+                    {"role": "user", "content": f"{self._build_llm_context(context)}\n\nВопрос пользователя: {question}"}
                 ],
-                max_tokens=500,
-                temperature=0.7
+                max_tokens=self.ANSWER_MAX_TOKENS,
+                temperature=0.7,
+                stream=True
             )
             
-            return response.choices[0].message.content.strip()
+            parts = []
+            last_update = time.monotonic()
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                parts.append(delta)
+                if on_partial is not None and time.monotonic() - last_update >= self.STREAM_UPDATE_INTERVAL:
+                    last_update = time.monotonic()
+                    await on_partial("".join(parts).strip())
             
-        except Exception as e:
-            print(f"Ошибка генерации LLM-ответа: {e}")
+            answer = "".join(parts).strip()
+            if answer:
+                self._cache_response(cache_key, answer)
+            return answer
+            
+        except Exception:
+            logger.exception("Ошибка генерации LLM-ответа")
+            return None
+    
+    async def _combined_llm_turn(self, question: str, context: DialogContext,
+                                 with_answer: bool = True) -> Optional[CombinedTurn]:
+        """
+        Проверяет релевантность вопроса и генерирует ответ одним вызовом LLM
+        
+        Args:
+            question: Вопрос пользователя
+            context: Контекст диалога
+            with_answer: Генерировать ли ответ (иначе запрашивается только вердикт,
+                поле answer остается пустым)
+            
+        Returns:
+            Результат проверки с ответом или None при ошибке
+        """
+        if not self.use_openai or not self.client:
+            return None
+        
+        cache_key = self._response_key('combined' if with_answer else 'verdict', question, context)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": self.COMBINED_PROMPT if with_answer else self.VERDICT_PROMPT},
+                    {"role": "user", "content": f"{self._build_llm_context(context)}\n\nВопрос пользователя: {question}"}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=self.ANSWER_MAX_TOKENS + self.VERDICT_MAX_TOKENS if with_answer else self.VERDICT_MAX_TOKENS,
+                temperature=0.7 if with_answer else 0.0
+            )
+            
+            turn = CombinedTurn.model_validate_json(response.choices[0].message.content)
+            self._cache_response(cache_key, turn)
+            return turn
+            
+        except Exception:
+            logger.exception("Ошибка совмещенного LLM-запроса")
+            return None
+    
+    @staticmethod
+    def _response_key(kind: str, question: str, context: DialogContext) -> Tuple:
+        """Ключ кэша ответов: стадия, программа и нормализованный вопрос"""
+        normalized = re.sub(r'\s+', ' ', question.lower().strip())[:128]
+        return kind, context.stage, context.current_program, normalized
+    
+    def _get_cached_response(self, key: Tuple):
+        """Возвращает сохраненный ответ LLM или None"""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.RESPONSE_CACHE_TTL:
+            del self._response_cache[key]
             return None
+        self._response_cache.move_to_end(key)
+        return entry[1]
+    
+    def _cache_response(self, key: Tuple, response) -> None:
+        """Сохраняет ответ LLM (вытесняются самые давно использованные)"""
+        self._response_cache[key] = (time.monotonic(), response)
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
     
-    def process_message(self, user_id: int, message: str) -> str:
+    @staticmethod
+    def _refusal(reason: str) -> str:
+        """Формирует ответ на нерелевантный вопрос"""
+        return f"❌ К сожалению, я могу отвечать только на вопросы, связанные с обучением в магистратуре ITMO.\n\n" \
+               f"Причина: {reason}\n\n" \
+               f"Спросите меня о программах, дисциплинах, поступлении или рекомендациях по обучению."
+    
+    async def process_message(self, user_id: int, message: str,
+                              on_partial: Optional[PartialCallback] = None) -> str:
         """
         Обрабатывает сообщение пользователя
         
         Args:
             user_id: ID пользователя
             message: Сообщение пользователя
+            on_partial: Обработчик промежуточного текста, если ответ генерирует LLM
             
         Returns:
             Ответ бота
@@ -284,12 +540,26 @@ class DialogSystem:
         context = self.get_or_create_context(user_id)
         
         # Проверяем релевантность вопроса
-        is_relevant, reason = self.relevance_filter.is_relevant(message, context)
+        llm_answer = None
+        verdict = self.relevance_filter.check_keywords(message)
+        if verdict is None:
+            # Ключевые слова не определили тему - проверку релевантности
+            # и ответ получаем от LLM одним запросом; ответ используется
+            # только в свободном чате, поэтому в остальных стадиях
+            # запрашивается только вердикт
+            turn = await self._combined_llm_turn(
+                message, context, with_answer=context.stage in self.ANSWER_STAGES
+            )
+            if turn is not None:
+                verdict = (turn.is_relevant, turn.reason)
+                if turn.is_relevant and turn.answer:
+                    llm_answer = turn.answer.strip()
+            else:
+                verdict = self.relevance_filter.check_context(message, context)
         
+        is_relevant, reason = verdict
         if not is_relevant:
-            return f"❌ К сожалению, я могу отвечать только на вопросы, связанные с обучением в магистратуре ITMO.\n\n" \
-                   f"Причина: {reason}\n\n" \
-                   f"Спросите меня о программах, дисциплинах, поступлении или рекомендациях по обучению."
+            return self._refusal(reason)
         
         # Определяем намерение
         intent = self.relevance_filter.extract_intent(message)
@@ -298,20 +568,20 @@ class DialogSystem:
         if context.stage == "greeting":
             return self._handle_greeting(context, message, intent)
         elif context.stage == "profile":
-            return self._handle_profile(context, message, intent)
+            return await self._handle_profile(context, message, intent, on_partial, llm_answer)
         elif context.stage == "recommendation":
-            return self._handle_recommendation(context, message, intent)
+            return await self._handle_recommendation(context, message, intent, on_partial, llm_answer)
         else:
-            return self._handle_chat(context, message, intent)
+            return await self._handle_chat(context, message, intent, on_partial, llm_answer)
     
     def _handle_greeting(self, context: DialogContext, message: str, intent: str) -> str:
         """Обработка приветственной стадии"""
         message_lower = message.lower()
         
         # Проверяем FAQ
-        for keyword, answer in self.faq_answers.items():
-            if keyword in message_lower:
-                return answer
+        match = self._faq_re.search(message_lower)
+        if match:
+            return self.faq_answers[match.group()]
         
         # Если пользователь хочет узнать о программах
         if 'программ' in message_lower or 'магистратур' in message_lower:
@@ -333,23 +603,22 @@ class DialogSystem:
                "3. Что вас интересует в IT?\n" \
                "4. Какие у вас карьерные цели?"
     
-    def _handle_profile(self, context: DialogContext, message: str, intent: str) -> str:
+    async def _handle_profile(self, context: DialogContext, message: str, intent: str,
+                              on_partial: Optional[PartialCallback] = None,
+                              llm_answer: Optional[str] = None) -> str:
         """Обработка стадии сбора профиля"""
         # Сохраняем информацию о пользователе
-        profile_data = self.db.get_user_profile(context.user_id)
+        profile_data = await asyncio.to_thread(self.db.get_user_profile, context.user_id)
         
         # Простая обработка - сохраняем как интересы
         if not profile_data.get('background'):
-            profile_data['background'] = [message]
-            self.db.update_user_profile(context.user_id, profile_data)
+            self.db.update_user_profile(context.user_id, {'background': [message]})
             return "📝 Принято! Расскажите о своих навыках и интересах в IT."
         elif not profile_data.get('interests'):
-            profile_data['interests'] = [message]
-            self.db.update_user_profile(context.user_id, profile_data)
+            self.db.update_user_profile(context.user_id, {'interests': [message]})
             return "📝 Хорошо! А какие у вас карьерные цели?"
         elif not profile_data.get('goals'):
-            profile_data['goals'] = [message]
-            self.db.update_user_profile(context.user_id, profile_data)
+            self.db.update_user_profile(context.user_id, {'goals': [message]})
             context.stage = "recommendation"
             return "✅ Спасибо! Теперь я могу дать вам рекомендации.\n\n" \
                    "Хотите:\n" \
@@ -358,9 +627,11 @@ class DialogSystem:
                    "3. Узнать подробнее о конкретной программе"
         
         context.stage = "chat"
-        return self._handle_chat(context, message, intent)
+        return await self._handle_chat(context, message, intent, on_partial, llm_answer)
     
-    def _handle_recommendation(self, context: DialogContext, message: str, intent: str) -> str:
+    async def _handle_recommendation(self, context: DialogContext, message: str, intent: str,
+                                     on_partial: Optional[PartialCallback] = None,
+                                     llm_answer: Optional[str] = None) -> str:
         """Обработка стадии рекомендаций"""
         message_lower = message.lower()
         
@@ -373,36 +644,42 @@ class DialogSystem:
         
         if 'дисциплин' in message_lower or 'электив' in message_lower:
             if context.current_program:
-                recommendations = self.recommender.recommend_courses(
-                    context.user_id, context.current_program
+                recommendations = await asyncio.to_thread(
+                    self.recommender.recommend_courses, context.user_id, context.current_program
                 )
                 return self.recommender.format_recommendations(recommendations)
             else:
                 programs = self.db.get_all_programs()
                 if programs:
                     context.current_program = programs[0].id
-                    recommendations = self.recommender.recommend_courses(
-                        context.user_id, context.current_program
+                    recommendations = await asyncio.to_thread(
+                        self.recommender.recommend_courses, context.user_id, context.current_program
                     )
                     return f"📖 Рекомендации для программы {programs[0].title}:\n\n" + \
                            self.recommender.format_recommendations(recommendations)
         
         # Если пользователь указал программу
-        programs = self.db.get_all_programs()
-        for prog in programs:
-            if prog.title.lower() in message_lower or prog.id in message_lower:
-                context.current_program = prog.id
-                return self.db.get_program_summary(prog.id)
+        program_id = self._find_program(message_lower)
+        if program_id:
+            context.current_program = program_id
+            return self.db.get_program_summary(program_id)
         
         context.stage = "chat"
-        return self._handle_chat(context, message, intent)
+        return await self._handle_chat(context, message, intent, on_partial, llm_answer)
     
-    def _handle_chat(self, context: DialogContext, message: str, intent: str) -> str:
-        """Обработка общего чата"""
+    async def _handle_chat(self, context: DialogContext, message: str, intent: str,
+                           on_partial: Optional[PartialCallback] = None,
+                           llm_answer: Optional[str] = None) -> str:
+        """
+        Обработка общего чата
+        
+        Args:
+            llm_answer: Ответ, уже полученный от LLM вместе с проверкой релевантности
+        """
         message_lower = message.lower()
         
-        # Сначала пробуем получить ответ от LLM
-        llm_response = self._generate_llm_response(message, context)
+        # Сначала пробуем получить ответ от LLM (если его еще нет)
+        llm_response = llm_answer or await self._generate_llm_response(message, context, on_partial)
         if llm_response:
             # Сохраняем вопрос в контекст
             context.questions_asked.append(message)
@@ -420,17 +697,16 @@ class DialogSystem:
                 return "По вашему запросу дисциплины не найдены."
         
         # Информация о программе
-        programs = self.db.get_all_programs()
-        for prog in programs:
-            if prog.title.lower() in message_lower or prog.id in message_lower:
-                context.current_program = prog.id
-                return self.db.get_program_summary(prog.id)
+        program_id = self._find_program(message_lower)
+        if program_id:
+            context.current_program = program_id
+            return self.db.get_program_summary(program_id)
         
         # Рекомендации
         if 'рекоменд' in message_lower or 'посовет' in message_lower:
             if context.current_program:
-                recommendations = self.recommender.recommend_courses(
-                    context.user_id, context.current_program
+                recommendations = await asyncio.to_thread(
+                    self.recommender.recommend_courses, context.user_id, context.current_program
                 )
                 return self.recommender.format_recommendations(recommendations)
             else:
@@ -439,12 +715,15 @@ class DialogSystem:
         # Учебный план
         if 'план' in message_lower or 'учебн' in message_lower:
             if context.current_program:
-                return self.recommender.get_study_plan(context.user_id, context.current_program)
+                return await asyncio.to_thread(
+                    self.recommender.get_study_plan, context.user_id, context.current_program
+                )
             else:
                 return "Сначала выберите программу."
         
         # Сравнение
         if 'сравн' in message_lower or intent == 'compare':
+            programs = self.db.get_all_programs()
             if len(programs) >= 2:
                 return self.db.compare_programs(programs[0].id, programs[1].id)
         
@@ -479,6 +758,9 @@ if __name__ == "__main__":
         "Какая погода?"
     ]
     
-    for msg in test_messages:
-        print(f"User: {msg}")
-        print(f"Bot: {dialog.process_message(1, msg)}\n")
+    async def run_dialog():
+        for msg in test_messages:
+            print(f"User: {msg}")
+            print(f"Bot: {await dialog.process_message(1, msg)}\n")
+    
+    asyncio.run(run_dialog())
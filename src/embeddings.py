@@ -1,24 +1,130 @@
 """
 Модуль для работы с эмбеддингами на основе модели ru-bge-m3
 """
-from typing import List, Union
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple, Union
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import torch
+
+
+class EmbeddingCache:
+    """Дисковый кэш эмбеддингов (SQLite), ключ - хэш модели и текста"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу базы кэша
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model_name: str, normalize: bool, text: str) -> bytes:
+        """Вычисляет ключ кэша для текста"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{model_name}\0{int(normalize)}\0".encode())
+        digest.update(text.encode())
+        return digest.digest()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Возвращает найденные в кэше векторы (float32)"""
+        found = {}
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float16).astype(np.float32)
+        return found
+    
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        """Сохраняет векторы в кэш (в float16 для экономии места)"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float16).tobytes()) for key, vector in items.items()]
+            )
+            self._conn.commit()
+
+
+# Известные размерности эмбеддингов (чтобы не загружать модель ради размерности)
+KNOWN_EMBEDDING_DIMS = {
+    "BAAI/bge-m3": 1024,
+}
 
 
 class EmbeddingModel:
     """Класс для работы с эмбеддингами на основе ru-bge-m3"""
     
-    def __init__(self, model_name: str = "BAAI/bge-m3"):
+    def __init__(self, model_name: str = "BAAI/bge-m3", device: Optional[str] = None,
+                 use_fp16: bool = True, cache_path: Optional[str] = None):
         """
         Инициализация модели эмбеддингов
         
+        Веса модели загружаются при первом обращении к self.model.
+        
         Args:
             model_name: Название модели (по умолчанию ru-bge-m3)
+            device: Устройство для инференса (по умолчанию cuda, если доступна)
+            use_fp16: Использовать половинную точность (только на GPU)
+            cache_path: Путь к дисковому кэшу эмбеддингов (по умолчанию из
+                EMBEDDING_CACHE_PATH; пустая строка отключает кэш)
         """
+        if cache_path is None:
+            cache_path = os.getenv('EMBEDDING_CACHE_PATH', 'data/embeddings_cache.sqlite3')
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
-        self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.device = device
+        self.use_fp16 = use_fp16
+        self._model: Optional[SentenceTransformer] = None
+        self._embedding_dim: Optional[int] = KNOWN_EMBEDDING_DIMS.get(model_name)
+        self._lock = threading.Lock()
+    
+    @property
+    def model(self) -> SentenceTransformer:
+        """Модель SentenceTransformer (загружается при первом обращении)"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # На CPU половинная точность не ускоряет инференс, поэтому FP16 только для GPU
+                    use_fp16 = self.use_fp16 and self.device.startswith("cuda")
+                    dtype = torch.float16 if use_fp16 else torch.float32
+                    model = SentenceTransformer(
+                        self.model_name,
+                        device=self.device,
+                        model_kwargs={"torch_dtype": dtype}
+                    )
+                    # Модель используется только для инференса
+                    model.eval()
+                    self._model = model
+        return self._model
+    
+    @property
+    def embedding_dim(self) -> int:
+        """Размерность эмбеддингов"""
+        if self._embedding_dim is None:
+            self._embedding_dim = self.model.get_sentence_embedding_dimension()
+        return self._embedding_dim
     
     def encode(self, text: Union[str, List[str]], normalize: bool = True) -> np.ndarray:
         """
@@ -31,12 +137,50 @@ class EmbeddingModel:
         Returns:
             Массив эмбеддингов
         """
-        embeddings = self.model.encode(
-            text,
-            normalize_embeddings=normalize,
-            show_progress_bar=False
-        )
-        return embeddings
+        if isinstance(text, str):
+            return self._encode_cached([text], normalize)[0]
+        return self._encode_cached(list(text), normalize)
+    
+    def _run_model(self, texts: List[str], normalize: bool, batch_size: int) -> np.ndarray:
+        """Прямой проход модели без учета градиентов"""
+        with torch.inference_mode():
+            return self.model.encode(
+                texts,
+                normalize_embeddings=normalize,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+    
+    def _encode_cached(self, texts: List[str], normalize: bool, batch_size: int = 32) -> np.ndarray:
+        """
+        Кодирует тексты, беря уже вычисленные эмбеддинги из дискового кэша
+        
+        Returns:
+            Массив эмбеддингов в порядке texts
+        """
+        if self.cache is None:
+            return self._run_model(texts, normalize, batch_size)
+        
+        keys = [EmbeddingCache.make_key(self.model_name, normalize, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        
+        # Модель вызываем только для отсутствующих в кэше (уникальных) текстов
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        
+        if missing:
+            vectors = self._run_model(list(missing.values()), normalize, batch_size)
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            cached.update(computed)
+        
+        result = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            result[i] = cached[key]
+        return result
     
     def encode_course(self, course_name: str, course_description: str = "", 
                      course_tags: List[str] = None) -> np.ndarray:
@@ -51,17 +195,7 @@ class EmbeddingModel:
         Returns:
             Эмбеддинг дисциплины
         """
-        # Формируем текст для кодирования
-        text_parts = [course_name]
-        
-        if course_description:
-            text_parts.append(course_description)
-        
-        if course_tags:
-            text_parts.extend(course_tags)
-        
-        text = " ".join(text_parts)
-        return self.encode(text)
+        return self.encode(self.course_text(course_name, course_description, course_tags))
     
     def encode_user_profile(self, background: List[str], interests: List[str],
                            skills: List[str], goals: List[str]) -> np.ndarray:
@@ -77,23 +211,7 @@ class EmbeddingModel:
         Returns:
             Эмбеддинг профиля пользователя
         """
-        # Формируем текст для кодирования
-        text_parts = []
-        
-        if background:
-            text_parts.extend(background)
-        
-        if interests:
-            text_parts.extend(interests)
-        
-        if skills:
-            text_parts.extend(skills)
-        
-        if goals:
-            text_parts.extend(goals)
-        
-        text = " ".join(text_parts)
-        return self.encode(text)
+        return self.encode(self.profile_text(background, interests, skills, goals))
     
     def encode_program(self, program_title: str, program_description: str,
                       skills: List[str], career: List[str]) -> np.ndarray:
@@ -109,19 +227,31 @@ class EmbeddingModel:
         Returns:
             Эмбеддинг программы
         """
-        text_parts = [program_title]
-        
-        if program_description:
-            text_parts.append(program_description)
-        
-        if skills:
-            text_parts.extend(skills)
-        
-        if career:
-            text_parts.extend(career)
-        
-        text = " ".join(text_parts)
-        return self.encode(text)
+        return self.encode(self.program_text(program_title, program_description, skills, career))
+    
+    # Тексты для кодирования; пустые поля пропускаются без промежуточного списка
+    
+    @staticmethod
+    def course_text(course_name: str, course_description: str = "",
+                    course_tags: List[str] = None) -> str:
+        """Текст дисциплины для кодирования"""
+        return " ".join(filter(None, (course_name, course_description, *(course_tags or ()))))
+    
+    @staticmethod
+    def profile_text(background: List[str], interests: List[str],
+                     skills: List[str], goals: List[str]) -> str:
+        """Текст профиля пользователя для кодирования"""
+        return " ".join(filter(None, itertools.chain(
+            background or (), interests or (), skills or (), goals or ()
+        )))
+    
+    @staticmethod
+    def program_text(program_title: str, program_description: str,
+                     skills: List[str], career: List[str]) -> str:
+        """Текст программы для кодирования"""
+        return " ".join(filter(None, (
+            program_title, program_description, *(skills or ()), *(career or ())
+        )))
     
     def compute_similarity(self, embedding1: np.ndarray, 
                           embedding2: np.ndarray) -> float:
@@ -138,6 +268,42 @@ class EmbeddingModel:
         # Косинусное сходство для нормализованных векторов = скалярное произведение
         return float(np.dot(embedding1, embedding2))
     
+    def similarity_matrix(self, queries: np.ndarray, corpus: np.ndarray) -> np.ndarray:
+        """
+        Вычислить косинусное сходство между наборами эмбеддингов одной операцией
+        
+        Args:
+            queries: Нормализованные эмбеддинги запросов, форма (M, D) или (D,)
+            corpus: Нормализованные эмбеддинги корпуса, форма (N, D)
+            
+        Returns:
+            Матрица сходств формы (M, N) (или вектор (N,) для одного запроса)
+        """
+        corpus = np.ascontiguousarray(corpus, dtype=np.float32)
+        return np.asarray(queries, dtype=np.float32) @ corpus.T
+    
+    def top_k(self, query: np.ndarray, corpus: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        Найти k наиболее похожих на запрос элементов корпуса
+        
+        Args:
+            query: Нормализованный эмбеддинг запроса, форма (D,)
+            corpus: Нормализованные эмбеддинги корпуса, форма (N, D)
+            k: Количество результатов
+            
+        Returns:
+            Список кортежей (индекс в корпусе, сходство) по убыванию сходства
+        """
+        scores = self.similarity_matrix(query, corpus)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        
+        # argpartition отбирает k лучших за O(N), сортируются только они
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+    
     def batch_encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         """
         Пакетное кодирование текстов
@@ -149,16 +315,12 @@ class EmbeddingModel:
         Returns:
             Массив эмбеддингов
         """
-        return self.model.encode(
-            texts,
-            normalize_embeddings=True,
-            batch_size=batch_size,
-            show_progress_bar=False
-        )
+        return self._encode_cached(list(texts), normalize=True, batch_size=batch_size)
 
 
 # Глобальный экземпляр модели для повторного использования
 _model_instance = None
+_model_instance_lock = threading.Lock()
 
 
 def get_embedding_model(model_name: str = "BAAI/bge-m3") -> EmbeddingModel:
@@ -173,5 +335,7 @@ def get_embedding_model(model_name: str = "BAAI/bge-m3") -> EmbeddingModel:
     """
     global _model_instance
     if _model_instance is None:
-        _model_instance = EmbeddingModel(model_name)
+        with _model_instance_lock:
+            if _model_instance is None:
+                _model_instance = EmbeddingModel(model_name)
     return _model_instance
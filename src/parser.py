@@ -1,27 +1,227 @@
 """
 Модуль для парсинга данных с сайтов магистратур ITMO
 """
+import asyncio
+import logging
+import os
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-from typing import Dict, List, Optional
-import json
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 import re
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# JSON данных страницы Next.js (ищется в байтах, без построения DOM)
+_NEXT_DATA_RE = re.compile(rb'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.DOTALL)
+
+
+def _dig(data, *path):
+    """Возвращает значение по пути ключей path или None, если путь прерывается"""
+    for key in path:
+        if type(data) is not dict:
+            return None
+        data = data.get(key)
+    return data
+
+
+def _first(data: Dict, keys: Tuple[str, ...]):
+    """Возвращает первое непустое значение по ключам keys или None"""
+    for key in keys:
+        if value := data.get(key):
+            return value
+    return None
+
+
+def _plain_item(name: str, item: Optional[Dict]) -> str:
+    """Элемент поля-списка - только название"""
+    return name
+
+
+# Ключи зачетных единиц и семестра дисциплины
+_CREDITS_KEYS = ('credits', 'zachet')
+_SEMESTER_KEYS = ('semester', 'semestr')
+
+
+def _course_item(name: str, item: Optional[Dict]) -> Dict:
+    """Элемент списка дисциплин"""
+    if item is None:
+        return {'name': name, 'type': '', 'credits': '', 'semester': ''}
+    return {
+        'name': name,
+        'type': str(item.get('type', '')),
+        'credits': str(_first(item, _CREDITS_KEYS) or ''),
+        'semester': str(_first(item, _SEMESTER_KEYS) or '')
+    }
+
+
+@dataclass(frozen=True)
+class _ListSpec:
+    """Правило извлечения поля-списка из данных программы"""
+    keys: Tuple[str, ...]  # ключи, под которыми может лежать список
+    item_keys: Tuple[str, ...]  # ключи названия элемента-словаря, по приоритету
+    min_len: int = 0  # строковый элемент принимается, если длиннее min_len...
+    max_len: Optional[int] = None  # ...и короче max_len
+    nested_keys: Tuple[str, ...] = ()  # ключи списков внутри значения-словаря
+    text_min_len: Optional[int] = None  # значение-строка берется целиком, если длиннее
+    cap: Optional[int] = None  # максимальное число элементов
+    build: Callable[[str, Optional[Dict]], object] = _plain_item
+
+
+# Ключи описания программы
+_DESCRIPTION_KEYS = ('description', 'about', 'text', 'content')
+
+# Модули учебного плана
+_CURRICULUM_SPEC = _ListSpec(
+    keys=('curriculum', 'studyPlan', 'study_plan', 'modules', 'disciplines'),
+    item_keys=('name', 'title'),
+    nested_keys=('modules',),
+)
+
+# Поля-списки программы
+_LIST_SPECS = {
+    'courses': _ListSpec(
+        keys=('courses', 'disciplines', 'subjects', 'items'),
+        item_keys=('name', 'title', 'subject'),
+        cap=50,
+        build=_course_item,
+    ),
+    'requirements': _ListSpec(
+        keys=('requirements', 'admission', 'entry', 'requirementsList'),
+        item_keys=('text', 'name', 'title'),
+        min_len=10,
+        text_min_len=20,
+        cap=10,
+    ),
+    'skills': _ListSpec(
+        keys=('skills', 'competencies', 'outcomes', 'results'),
+        item_keys=('text', 'name', 'title'),
+        min_len=5,
+        max_len=100,
+        cap=20,
+    ),
+    'career': _ListSpec(
+        keys=('career', 'jobs', 'employment', 'opportunities'),
+        item_keys=('text', 'name', 'title'),
+        min_len=10,
+        nested_keys=('items', 'list', 'companies'),
+        cap=10,
+    ),
+}
+
+
+def _build_key_routes() -> Dict[str, Tuple[Tuple[str, int], ...]]:
+    """Сопоставляет ключу данных программы поля записи и приоритет ключа в каждом из них"""
+    field_keys = {
+        'description': _DESCRIPTION_KEYS,
+        'curriculum': _CURRICULUM_SPEC.keys,
+        **{field: spec.keys for field, spec in _LIST_SPECS.items()},
+    }
+    routes: Dict[str, List[Tuple[str, int]]] = {}
+    for field, keys in field_keys.items():
+        for priority, key in enumerate(keys):
+            routes.setdefault(key, []).append((field, priority))
+    return {key: tuple(targets) for key, targets in routes.items()}
+
+
+# Ключ данных программы -> ((поле записи, приоритет ключа), ...)
+_KEY_ROUTES = _build_key_routes()
+
+# Поля записи, заполняемые из данных программы
+_RECORD_FIELDS = ('description', 'curriculum', *_LIST_SPECS)
 
 
 class ITMOMasterParser:
     """Парсер данных с сайта abit.itmo.ru"""
     
-    def __init__(self):
+    # Максимум одновременных соединений при параллельной загрузке страниц
+    FETCH_CONCURRENCY = 16
+    
+    # Время кэширования DNS-ответов, в секундах
+    DNS_CACHE_TTL = 300
+    
+    __slots__ = ('base_url', 'session', 'cache_path', '_cache')
+    
+    def __init__(self, cache_path: Optional[str] = None):
+        """
+        Args:
+            cache_path: Путь к кэшу разобранных страниц (по умолчанию из
+                PAGE_CACHE_PATH; пустая строка отключает сохранение на диск)
+        """
         self.base_url = "https://abit.itmo.ru"
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            # Страницы со встроенным JSON хорошо сжимаются; Brotli распаковывают
+            # urllib3 и aiohttp при установленном пакете brotli
+            'Accept-Encoding': 'br, gzip, deflate'
         })
+        
+        # Пул keep-alive соединений и повтор запросов при временных ошибках сервера
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        )
+        self.session.mount('https://', adapter)
+        
+        if cache_path is None:
+            cache_path = os.getenv('PAGE_CACHE_PATH', 'data/pages_cache.json')
+        self.cache_path = cache_path
+        self._cache: Optional[Dict[str, Dict]] = None
+    
+    @property
+    def page_cache(self) -> Dict[str, Dict]:
+        """Кэш разобранных страниц: URL -> {etag, last_modified, data} (загружается при первом обращении)"""
+        if self._cache is None:
+            self._cache = self.load_from_json(self.cache_path) if self.cache_path else {}
+        return self._cache
+    
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        """Заголовки условного запроса по сохраненной версии страницы"""
+        entry = self.page_cache.get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def _remember_page(self, url: str, headers, data: Dict) -> bool:
+        """
+        Сохраняет разобранную страницу в кэш, если сервер вернул ETag или Last-Modified
+        
+        Returns:
+            True, если страница сохранена
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not data or not (etag or last_modified):
+            return False
+        self.page_cache[url] = {'etag': etag, 'last_modified': last_modified, 'data': data}
+        return True
+    
+    def save_page_cache(self):
+        """Записывает кэш разобранных страниц на диск"""
+        if not self.cache_path or self._cache is None:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.save_to_json(self._cache, self.cache_path)
     
     def parse_program_page(self, url: str) -> Dict:
         """
         Парсит страницу магистерской программы
         
+        Если страница не изменилась с прошлого разбора (ответ 304 на
+        условный запрос), данные берутся из кэша.
+        
         Args:
             url: URL страницы программы
             
@@ -29,368 +229,191 @@ class ITMOMasterParser:
             Словарь с данными программы
         """
         try:
-            response = self.session.get(url, timeout=30)
+            response = self.session.get(url, headers=self._conditional_headers(url), timeout=30)
+            if response.status_code == 304:
+                return self.page_cache[url]['data']
             response.raise_for_status()
+            data = self._parse_html(url, response.content)
+            if self._remember_page(url, response.headers, data):
+                self.save_page_cache()
+            return data
             
-            # Извлекаем данные из __NEXT_DATA__
-            next_data = self._extract_next_data(response.text)
-            if not next_data:
-                print(f"Не удалось найти __NEXT_DATA__ на странице {url}")
-                return {}
-            
-            program_data = {
-                'url': url,
-                'title': self._extract_title(next_data),
-                'description': self._extract_description(next_data),
-                'curriculum': self._extract_curriculum(next_data),
-                'courses': self._extract_courses(next_data),
-                'requirements': self._extract_requirements(next_data),
-                'skills': self._extract_skills(next_data),
-                'career': self._extract_career(next_data)
-            }
-            
-            return program_data
-            
-        except Exception as e:
-            print(f"Ошибка при парсинге {url}: {e}")
+        except Exception:
+            logger.exception("Ошибка при парсинге %s", url)
             return {}
     
-    def _extract_next_data(self, html: str) -> Optional[Dict]:
+    def _parse_html(self, url: str, html: bytes) -> Dict:
+        """Извлекает данные программы из HTML страницы"""
+        # Извлекаем данные из __NEXT_DATA__
+        next_data = self._extract_next_data(html)
+        if not next_data:
+            logger.warning("Не удалось найти __NEXT_DATA__ на странице %s", url)
+            return {}
+        
+        # Данные программы лежат в pageProps под ключами program и data
+        page_props = _dig(next_data, 'props', 'pageProps') or {}
+        sources = [source for source in (page_props.get('program'), page_props.get('data'))
+                   if type(source) is dict]
+        
+        return {
+            'url': url,
+            'title': self._extract_title(page_props),
+            **self._extract_all(sources)
+        }
+    
+    def _extract_next_data(self, html: bytes) -> Optional[Dict]:
         """Извлекает JSON из тега __NEXT_DATA__"""
+        match = _NEXT_DATA_RE.search(html)
+        if match:
+            try:
+                return orjson.loads(match.group(1))
+            except orjson.JSONDecodeError:
+                return None
+        
+        # Тег с нестандартной разметкой ищем через полноценный разбор HTML
         soup = BeautifulSoup(html, 'lxml')
         script_tag = soup.find('script', id='__NEXT_DATA__')
-        if script_tag:
+        if script_tag and script_tag.string:
             try:
-                return json.loads(script_tag.string)
-            except json.JSONDecodeError:
+                return orjson.loads(script_tag.string)
+            except orjson.JSONDecodeError:
                 return None
         return None
     
-    def _extract_title(self, next_data: Dict) -> str:
-        """Извлекает название программы из __NEXT_DATA__"""
-        try:
-            # Путь к данным программы в Next.js
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
-            
-            # Данные находятся в apiProgram
-            if 'apiProgram' in page_props:
-                api_program = page_props['apiProgram']
-                if isinstance(api_program, dict):
-                    title = api_program.get('title')
-                    if title:
-                        return str(title)
-            
-            return "Неизвестная программа"
-        except Exception as e:
-            print(f"Ошибка при извлечении заголовка: {e}")
-            return "Неизвестная программа"
+    def _extract_title(self, page_props: Dict) -> str:
+        """Извлекает название программы (pageProps.apiProgram.title)"""
+        title = _dig(page_props, 'apiProgram', 'title')
+        return str(title) if title else "Неизвестная программа"
     
-    def _extract_description(self, next_data: Dict) -> str:
-        """Извлекает описание программы из __NEXT_DATA__"""
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
-            
-            # Поиск описания в данных программы
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    for key in ['description', 'about', 'text', 'content']:
-                        if key in program and program[key]:
-                            desc = str(program[key])
-                            if len(desc) > 20:
-                                return desc
-            
-            # Альтернативный путь
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['description', 'about', 'text', 'content']:
-                        if key in data and data[key]:
-                            desc = str(data[key])
-                            if len(desc) > 20:
-                                return desc
+    def _extract_all(self, sources: List[Dict]) -> Dict:
+        """
+        Извлекает все поля записи программы за один проход по данным
+        
+        Каждый ключ источника направляется в поля, которые из него
+        заполняются (_KEY_ROUTES). Значения поля затем разбираются в порядке
+        приоритета ключей, как при поиске по каждому полю отдельно. Поля,
+        заполненные по предыдущему источнику (найдено описание, набран
+        лимит списка), в следующих источниках не рассматриваются.
+        
+        Args:
+            sources: Словари с данными программы (program, data)
             
-            return ""
-        except Exception as e:
-            print(f"Ошибка при извлечении описания: {e}")
-            return ""
-    
-    def _extract_curriculum(self, next_data: Dict) -> Dict:
-        """Извлекает учебный план из __NEXT_DATA__"""
-        curriculum = {
-            'years': [],
-            'modules': []
+        Returns:
+            Словарь с описанием, учебным планом и полями-списками программы
+        """
+        record = {
+            'description': "",
+            'curriculum': {'years': [], 'modules': []},
+            **{field: [] for field in _LIST_SPECS}
         }
+        filled = set()
         
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
+        for source in sources:
+            found = {field: [] for field in _RECORD_FIELDS if field not in filled}
+            for key, value in source.items():
+                for field, priority in _KEY_ROUTES.get(key, ()):
+                    if field in found:
+                        found[field].append((priority, value))
             
-            # Поиск учебного плана в данных
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    # Проверяем различные ключи для учебного плана
-                    for key in ['curriculum', 'studyPlan', 'study_plan', 'modules', 'disciplines']:
-                        if key in program:
-                            data = program[key]
-                            if isinstance(data, dict):
-                                if 'modules' in data:
-                                    modules = data['modules']
-                                    if isinstance(modules, list):
-                                        for module in modules:
-                                            if isinstance(module, dict):
-                                                module_name = module.get('name') or module.get('title')
-                                                if module_name:
-                                                    curriculum['modules'].append(str(module_name))
-                                            elif isinstance(module, str):
-                                                curriculum['modules'].append(module)
-                                if 'years' in data:
-                                    years = data['years']
-                                    if isinstance(years, list):
-                                        curriculum['years'] = [str(y) for y in years]
-                            elif isinstance(data, list):
-                                for item in data:
-                                    if isinstance(item, dict):
-                                        module_name = item.get('name') or item.get('title')
-                                        if module_name:
-                                            curriculum['modules'].append(str(module_name))
-                                    elif isinstance(item, str):
-                                        curriculum['modules'].append(item)
+            values = {
+                field: [value for _, value in sorted(matches, key=lambda match: match[0])]
+                for field, matches in found.items()
+            }
             
-            # Альтернативный путь через data
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['curriculum', 'studyPlan', 'study_plan', 'modules', 'disciplines']:
-                        if key in data:
-                            curriculum_data = data[key]
-                            if isinstance(curriculum_data, list):
-                                for item in curriculum_data:
-                                    if isinstance(item, dict):
-                                        module_name = item.get('name') or item.get('title')
-                                        if module_name:
-                                            curriculum['modules'].append(str(module_name))
-                                    elif isinstance(item, str):
-                                        curriculum['modules'].append(item)
-        
-        except Exception as e:
-            print(f"Ошибка при извлечении учебного плана: {e}")
-        
-        return curriculum
-    
-    def _extract_courses(self, next_data: Dict) -> List[Dict]:
-        """Извлекает список дисциплин из __NEXT_DATA__"""
-        courses = []
-        
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
+            if 'description' in values:
+                record['description'] = self._extract_description(values['description'])
+                if record['description']:
+                    filled.add('description')
             
-            # Поиск дисциплин в данных программы
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    for key in ['courses', 'disciplines', 'subjects', 'items']:
-                        if key in program:
-                            data = program[key]
-                            if isinstance(data, list):
-                                for item in data:
-                                    if isinstance(item, dict):
-                                        course_name = item.get('name') or item.get('title') or item.get('subject')
-                                        if course_name:
-                                            course_info = {
-                                                'name': str(course_name),
-                                                'type': str(item.get('type', '')),
-                                                'credits': str(item.get('credits', '') or item.get('zachet', '')),
-                                                'semester': str(item.get('semester', '') or item.get('semestr', ''))
-                                            }
-                                            courses.append(course_info)
-                                    elif isinstance(item, str):
-                                        courses.append({'name': item, 'type': '', 'credits': '', 'semester': ''})
+            self._extract_curriculum(values['curriculum'], record['curriculum'])
             
-            # Альтернативный путь через data
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['courses', 'disciplines', 'subjects', 'items']:
-                        if key in data:
-                            courses_data = data[key]
-                            if isinstance(courses_data, list):
-                                for item in courses_data:
-                                    if isinstance(item, dict):
-                                        course_name = item.get('name') or item.get('title') or item.get('subject')
-                                        if course_name:
-                                            course_info = {
-                                                'name': str(course_name),
-                                                'type': str(item.get('type', '')),
-                                                'credits': str(item.get('credits', '') or item.get('zachet', '')),
-                                                'semester': str(item.get('semester', '') or item.get('semestr', ''))
-                                            }
-                                            courses.append(course_info)
-                                    elif isinstance(item, str):
-                                        courses.append({'name': item, 'type': '', 'credits': '', 'semester': ''})
+            for field, spec in _LIST_SPECS.items():
+                if field in values:
+                    self._walk(values[field], spec, record[field])
+                    if spec.cap is not None and len(record[field]) >= spec.cap:
+                        filled.add(field)
         
-        except Exception as e:
-            print(f"Ошибка при извлечении дисциплин: {e}")
-        
-        return courses[:50]
+        return record
     
-    def _extract_requirements(self, next_data: Dict) -> List[str]:
-        """Извлекает требования к поступающим из __NEXT_DATA__"""
-        requirements = []
-        
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
-            
-            # Поиск требований в данных программы
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    for key in ['requirements', 'admission', 'entry', 'requirementsList']:
-                        if key in program:
-                            data = program[key]
-                            if isinstance(data, list):
-                                for item in data:
-                                    if isinstance(item, dict):
-                                        req_text = item.get('text') or item.get('name') or item.get('title')
-                                        if req_text:
-                                            requirements.append(str(req_text))
-                                    elif isinstance(item, str):
-                                        if len(item) > 10:
-                                            requirements.append(item)
-                            elif isinstance(data, str) and len(data) > 20:
-                                requirements.append(data)
-            
-            # Альтернативный путь через data
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['requirements', 'admission', 'entry', 'requirementsList']:
-                        if key in data:
-                            req_data = data[key]
-                            if isinstance(req_data, list):
-                                for item in req_data:
-                                    if isinstance(item, dict):
-                                        req_text = item.get('text') or item.get('name') or item.get('title')
-                                        if req_text:
-                                            requirements.append(str(req_text))
-                                    elif isinstance(item, str) and len(item) > 10:
-                                        requirements.append(item)
-        
-        except Exception as e:
-            print(f"Ошибка при извлечении требований: {e}")
+    def _extract_description(self, values: List) -> str:
+        """Извлекает описание программы из значений-кандидатов"""
+        for value in values:
+            if value:
+                desc = str(value)
+                if len(desc) > 20:
+                    return desc
+        return ""
+    
+    def _extract_curriculum(self, values: List, curriculum: Dict):
+        """Дополняет учебный план (список модулей и годы обучения) из значений-кандидатов"""
+        self._walk(values, _CURRICULUM_SPEC, curriculum['modules'])
         
-        return requirements[:10]
+        for value in values:
+            if type(value) is dict and type(years := value.get('years')) is list:
+                curriculum['years'] = [str(y) for y in years]
     
-    def _extract_skills(self, next_data: Dict) -> List[str]:
-        """Извлекает навыки из __NEXT_DATA__"""
-        skills = []
+    def _walk(self, values: List, spec: _ListSpec, result: List) -> List:
+        """
+        Дополняет список элементов поля по правилу spec
         
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
-            
-            # Поиск навыков в данных программы
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    for key in ['skills', 'competencies', 'outcomes', 'results']:
-                        if key in program:
-                            data = program[key]
-                            if isinstance(data, list):
-                                for item in data:
-                                    if isinstance(item, dict):
-                                        skill_text = item.get('text') or item.get('name') or item.get('title')
-                                        if skill_text:
-                                            skills.append(str(skill_text))
-                                    elif isinstance(item, str) and 5 < len(item) < 100:
-                                        skills.append(item)
-            
-            # Альтернативный путь через data
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['skills', 'competencies', 'outcomes', 'results']:
-                        if key in data:
-                            skills_data = data[key]
-                            if isinstance(skills_data, list):
-                                for item in skills_data:
-                                    if isinstance(item, dict):
-                                        skill_text = item.get('text') or item.get('name') or item.get('title')
-                                        if skill_text:
-                                            skills.append(str(skill_text))
-                                    elif isinstance(item, str) and 5 < len(item) < 100:
-                                        skills.append(item)
+        Данные получены из orjson и содержат только встроенные типы, поэтому
+        тип значения проверяется сравнением type(...) is, без isinstance.
         
-        except Exception as e:
-            print(f"Ошибка при извлечении навыков: {e}")
+        Args:
+            values: Значения ключей поля в порядке приоритета ключей
+            spec: Правило извлечения поля
+            result: Уже собранные элементы поля
+            
+        Returns:
+            Список result (не длиннее spec.cap)
+        """
+        # Обход прекращается, как только набрано spec.cap элементов
+        cap = spec.cap if spec.cap is not None else float('inf')
+        for value in values:
+            if len(result) >= cap:
+                break
+            value_type = type(value)
+            if value_type is list:
+                self._collect_items(value, spec, result, cap)
+            elif value_type is dict:
+                for sub_key in spec.nested_keys:
+                    if type(sub_items := value.get(sub_key)) is list:
+                        self._collect_items(sub_items, spec, result, cap)
+            elif value_type is str and spec.text_min_len is not None \
+                    and len(value) > spec.text_min_len:
+                result.append(value)
         
-        return skills[:20]
+        return result
+    
+    @staticmethod
+    def _collect_items(items: List, spec: _ListSpec, result: List, cap: float):
+        """Добавляет в result подходящие элементы списка, пока в нем меньше cap элементов"""
+        for item in items:
+            if len(result) >= cap:
+                return
+            item_type = type(item)
+            if item_type is dict:
+                if name := _first(item, spec.item_keys):
+                    result.append(spec.build(str(name), item))
+            elif item_type is str and len(item) > spec.min_len \
+                    and (spec.max_len is None or len(item) < spec.max_len):
+                result.append(spec.build(item, None))
     
-    def _extract_career(self, next_data: Dict) -> List[str]:
-        """Извлекает информацию о карьере из __NEXT_DATA__"""
-        career = []
+    def parse_all_programs(self, urls: List[str]) -> Dict[str, Dict]:
+        """
+        Парсит несколько программ (синхронная обертка над parse_all_programs_async)
         
-        try:
-            props = next_data.get('props', {})
-            page_props = props.get('pageProps', {})
-            
-            # Поиск информации о карьере в данных программы
-            if 'program' in page_props:
-                program = page_props['program']
-                if isinstance(program, dict):
-                    for key in ['career', 'jobs', 'employment', 'opportunities']:
-                        if key in program:
-                            data = program[key]
-                            if isinstance(data, list):
-                                for item in data:
-                                    if isinstance(item, dict):
-                                        career_text = item.get('text') or item.get('name') or item.get('title')
-                                        if career_text:
-                                            career.append(str(career_text))
-                                    elif isinstance(item, str) and len(item) > 10:
-                                        career.append(item)
-                            elif isinstance(data, dict):
-                                for sub_key in ['items', 'list', 'companies']:
-                                    if sub_key in data:
-                                        sub_data = data[sub_key]
-                                        if isinstance(sub_data, list):
-                                            for item in sub_data:
-                                                if isinstance(item, dict):
-                                                    career_text = item.get('text') or item.get('name') or item.get('title')
-                                                    if career_text:
-                                                        career.append(str(career_text))
-                                                elif isinstance(item, str) and len(item) > 10:
-                                                    career.append(item)
+        Args:
+            urls: Список URL программ
             
-            # Альтернативный путь через data
-            if 'data' in page_props:
-                data = page_props['data']
-                if isinstance(data, dict):
-                    for key in ['career', 'jobs', 'employment', 'opportunities']:
-                        if key in data:
-                            career_data = data[key]
-                            if isinstance(career_data, list):
-                                for item in career_data:
-                                    if isinstance(item, dict):
-                                        career_text = item.get('text') or item.get('name') or item.get('title')
-                                        if career_text:
-                                            career.append(str(career_text))
-                                    elif isinstance(item, str) and len(item) > 10:
-                                        career.append(item)
-        
-        except Exception as e:
-            print(f"Ошибка при извлечении информации о карьере: {e}")
-        
-        return career[:10]
+        Returns:
+            Словарь с данными всех программ
+        """
+        return asyncio.run(self.parse_all_programs_async(urls))
     
-    def parse_all_programs(self, urls: List[str]) -> Dict[str, Dict]:
+    async def parse_all_programs_async(self, urls: List[str]) -> Dict[str, Dict]:
         """
-        Парсит несколько программ
+        Парсит несколько программ, загружая страницы параллельно
         
         Args:
             urls: Список URL программ
@@ -398,28 +421,53 @@ class ITMOMasterParser:
         Returns:
             Словарь с данными всех программ
         """
-        programs = {}
-        for url in urls:
-            program_id = url.split('/')[-1]
-            programs[program_id] = self.parse_program_page(url)
-        return programs
+        connector = aiohttp.TCPConnector(limit=self.FETCH_CONCURRENCY, ttl_dns_cache=self.DNS_CACHE_TTL)
+        async with aiohttp.ClientSession(headers=dict(self.session.headers), connector=connector) as session:
+            pages = await asyncio.gather(*[self._afetch(session, url) for url in urls])
+        self.save_page_cache()
+        
+        # ID программы - последний сегмент URL
+        return {url[url.rfind('/') + 1:]: data for url, data in zip(urls, pages)}
+    
+    async def _afetch(self, session: aiohttp.ClientSession, url: str) -> Dict:
+        """Загружает и разбирает страницу программы, при ошибке возвращает пустой словарь"""
+        try:
+            async with session.get(url, headers=self._conditional_headers(url),
+                                   timeout=aiohttp.ClientTimeout(total=30)) as response:
+                if response.status == 304:
+                    return self.page_cache[url]['data']
+                response.raise_for_status()
+                html = await response.read()
+                headers = response.headers
+        except Exception:
+            logger.warning("Ошибка при загрузке %s", url, exc_info=True)
+            return {}
+        
+        try:
+            data = self._parse_html(url, html)
+        except Exception:
+            logger.exception("Ошибка при парсинге %s", url)
+            return {}
+        self._remember_page(url, headers, data)
+        return data
     
     def save_to_json(self, data: Dict, filename: str):
         """Сохраняет данные в JSON файл"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     
     def load_from_json(self, filename: str) -> Dict:
         """Загружает данные из JSON файла"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(filename, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             return {}
 
 
 if __name__ == "__main__":
     # Тестирование парсера
+    logging.basicConfig(level=logging.INFO)
     parser = ITMOMasterParser()
     
     urls = [
@@ -1,12 +1,28 @@
 """
 Модуль для рекомендаций по выбору дисциплин
 """
-from typing import List, Dict, Tuple, Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Dict, Tuple, Optional
 from dataclasses import dataclass
-from src.database import Course, MasterProgram, ProgramDatabase
+from functools import cached_property
+import numpy as np
+from src.database import Course, CourseType, MasterProgram, ProgramDatabase
 from src.vector_db import QdrantVectorDB, get_vector_db
 from src.embeddings import EmbeddingModel, get_embedding_model
 
+logger = logging.getLogger(__name__)
+
+
+# Пул для фоновых записей в векторную базу
+_background_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="recommender-bg")
+
 
 @dataclass
 class UserProfile:
@@ -22,25 +38,124 @@ class UserProfile:
 class CourseRecommender:
     """Система рекомендаций дисциплин"""
     
+    # Размер пакета загрузки в векторную базу при индексации
+    INDEX_BATCH_SIZE = 128
+    
+    # Число пакетов, одновременно обрабатываемых при индексации
+    INDEX_WORKERS = 2
+    
+    # Число эмбеддингов профилей, хранимых в памяти
+    PROFILE_VECTOR_CACHE_SIZE = 10000
+    
+    # Максимальное число рекомендуемых программ
+    PROGRAM_RECOMMENDATION_LIMIT = 10
+    
+    # Кэш учебных планов: размер и время жизни (в секундах)
+    STUDY_PLAN_CACHE_SIZE = 1024
+    STUDY_PLAN_CACHE_TTL = 300
+    
     def __init__(self, db: ProgramDatabase, vector_db: QdrantVectorDB = None,
                  use_vector_search: bool = True):
         """
         Инициализация системы рекомендаций
         
+        Векторная база и модель эмбеддингов создаются при первом обращении,
+        поэтому без векторного поиска они не загружаются вовсе.
+        
         Args:
             db: База данных программ
             vector_db: Векторная база данных Qdrant (опционально)
             use_vector_search: Использовать ли векторный поиск
         """
         self.db = db
-        self.vector_db = vector_db or get_vector_db()
+        self._vector_db = vector_db
         self.use_vector_search = use_vector_search
-        self.embedding_model = get_embedding_model()
+        
+        # Эмбеддинги профилей: текст профиля -> вектор (вытесняются давно использованные)
+        self._profile_vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._profile_vectors_lock = threading.Lock()
+        
+        # Учебные планы: (пользователь, программа, профиль) -> (время, программа, текст)
+        self._study_plans: OrderedDict[Tuple, Tuple[float, MasterProgram, str]] = OrderedDict()
+        self._study_plans_lock = threading.Lock()
+        
+        # Тексты программ для классического скоринга: ID -> (программа, тексты)
+        self._program_texts: Dict[str, Tuple[MasterProgram, str, str, List[str]]] = {}
+        
+        # Обязательные дисциплины для учебного плана: ID -> (программа, дисциплины)
+        self._mandatory_courses: Dict[str, Tuple[MasterProgram, Tuple[Course, ...]]] = {}
+    
+    @cached_property
+    def vector_db(self) -> QdrantVectorDB:
+        """Векторная база данных Qdrant (подключение при первом обращении)"""
+        return self._vector_db or get_vector_db(embedding_model=self.embedding_model)
+    
+    @cached_property
+    def embedding_model(self) -> EmbeddingModel:
+        """Модель эмбеддингов (создается при первом обращении)"""
+        if self._vector_db is not None:
+            return self._vector_db.embedding_model
+        return get_embedding_model()
+    
+    def _profile_vector(self, user_id: int) -> Optional[np.ndarray]:
+        """
+        Возвращает эмбеддинг профиля пользователя
+        
+        Returns:
+            Эмбеддинг профиля или None, если профиль пуст
+        """
+        return self._profile_vectors_for([user_id]).get(user_id)
+    
+    def _profile_vectors_for(self, user_ids: List[int]) -> Dict[int, np.ndarray]:
+        """
+        Возвращает эмбеддинги профилей пользователей
+        
+        Векторы вычисляются по профилям из MongoDB и кэшируются по тексту
+        профиля, поэтому после изменения профиля вычисляются заново.
+        Отсутствующие в кэше профили кодируются одним пакетом.
+        
+        Returns:
+            Словарь ID пользователя -> эмбеддинг (пустые профили пропускаются)
+        """
+        texts = {}
+        for user_id in user_ids:
+            profile = self.db.get_user_profile(user_id)
+            text = self.embedding_model.profile_text(
+                profile.get('background'), profile.get('interests'),
+                profile.get('skills'), profile.get('goals')
+            )
+            if text:
+                texts[user_id] = text
+        
+        # Рекомендации вызываются из рабочих потоков (asyncio.to_thread)
+        vectors = {}
+        with self._profile_vectors_lock:
+            for text in texts.values():
+                vector = self._profile_vectors.get(text)
+                if vector is not None:
+                    self._profile_vectors.move_to_end(text)
+                    vectors[text] = vector
+        
+        missing = list({text for text in texts.values() if text not in vectors})
+        if missing:
+            computed = dict(zip(missing, self.embedding_model.encode(missing)))
+            vectors.update(computed)
+            with self._profile_vectors_lock:
+                self._profile_vectors.update(computed)
+                while len(self._profile_vectors) > self.PROFILE_VECTOR_CACHE_SIZE:
+                    self._profile_vectors.popitem(last=False)
+        
+        return {user_id: vectors[text] for user_id, text in texts.items()}
     
     def create_user_profile(self, user_id: int, background: List[str],
                            interests: List[str], skills: List[str],
                            goals: List[str]) -> UserProfile:
-        """Создает профиль пользователя"""
+        """
+        Создает профиль пользователя
+        
+        Запись в векторную базу выполняется в фоне и не задерживает ответ:
+        рекомендации строятся по профилю из MongoDB.
+        """
         profile = UserProfile(
             user_id=user_id,
             background=background,
@@ -49,27 +164,58 @@ class CourseRecommender:
             goals=goals
         )
         
-        # Сохраняем в MongoDB
-        self.db.update_user_profile(user_id, {
-            'background': background,
-            'interests': interests,
-            'skills': skills,
-            'goals': goals,
-            'preferred_program': ''
-        })
+        # Сохраняем в векторную базу для рекомендаций (параллельно с MongoDB)
+        if self.use_vector_search:
+            _background_executor.submit(self._save_profile_vector, profile)
+        
+        self._save_profile(profile)
+        return profile
+    
+    async def create_user_profile_async(self, user_id: int, background: List[str],
+                                        interests: List[str], skills: List[str],
+                                        goals: List[str]) -> UserProfile:
+        """
+        Создает профиль пользователя, не блокируя event loop
+        
+        Ожидается только запись в MongoDB; запись в векторную базу, как и в
+        create_user_profile, выполняется в фоне.
+        """
+        profile = UserProfile(
+            user_id=user_id,
+            background=background,
+            interests=interests,
+            skills=skills,
+            goals=goals
+        )
         
-        # Сохраняем в векторную базу для рекомендаций
         if self.use_vector_search:
-            self.vector_db.add_user_profile(
-                user_id=user_id,
-                background=background,
-                interests=interests,
-                skills=skills,
-                goals=goals
-            )
+            _background_executor.submit(self._save_profile_vector, profile)
         
+        await asyncio.to_thread(self._save_profile, profile)
         return profile
     
+    def _save_profile(self, profile: UserProfile):
+        """Сохраняет профиль в MongoDB"""
+        self.db.update_user_profile(profile.user_id, {
+            'background': profile.background,
+            'interests': profile.interests,
+            'skills': profile.skills,
+            'goals': profile.goals
+        }, create_defaults={'preferred_program': ''})
+    
+    def _save_profile_vector(self, profile: UserProfile):
+        """Сохраняет профиль в векторную базу (ошибка не мешает сохранению в MongoDB)"""
+        try:
+            self.vector_db.add_user_profile(
+                user_id=profile.user_id,
+                background=profile.background,
+                interests=profile.interests,
+                skills=profile.skills,
+                goals=profile.goals
+            )
+        except Exception:
+            logger.exception("Ошибка при добавлении профиля пользователя в векторную базу")
+    
     def recommend_courses(self, user_id: int, program_id: str,
                          limit: int = 5) -> List[Tuple[Course, float]]:
         """
@@ -103,27 +249,90 @@ class CourseRecommender:
         Returns:
             Список кортежей (дисциплина, оценка релевантности)
         """
+        program = self.db.get_program(program_id)
+        if not program:
+            return []
+        
+        profile_vector = self._profile_vector(user_id)
+        if profile_vector is None:
+            return []
+        
         # Получаем рекомендации из векторной базы
-        vector_results = self.vector_db.recommend_courses_for_user(
-            user_id=user_id,
-            program_id=program_id,
-            limit=limit
-        )
+        try:
+            vector_results = self.vector_db.search_courses(
+                profile_vector.tolist(),
+                program_id=program_id,
+                limit=limit,
+                with_payload=["name"]
+            )
+        except Exception:
+            logger.exception("Ошибка при поиске рекомендаций")
+            return []
         
-        # Преобразуем результаты в формат (Course, float)
-        recommendations = []
-        for result in vector_results:
-            course_id = result.get("id")
-            score = result.get("score", 0.0)
+        return self._match_courses(self._courses_by_name(program), vector_results)
+    
+    def recommend_courses_many(self, user_ids: List[int], program_id: str,
+                               limit: int = 5) -> Dict[int, List[Tuple[Course, float]]]:
+        """
+        Рекомендует выборные дисциплины сразу нескольким пользователям
+        
+        При векторном поиске профили кодируются одним пакетом, а поиск
+        выполняется пакетными запросами к Qdrant.
+        
+        Args:
+            user_ids: ID пользователей
+            program_id: ID программы
+            limit: Максимальное количество рекомендаций для каждого пользователя
             
-            # Получаем объект Course из базы данных
-            program = self.db.get_program(program_id)
-            if program:
-                for course in program.courses:
-                    if course.name == result.get("name"):
-                        recommendations.append((course, score))
-                        break
+        Returns:
+            Словарь ID пользователя -> список кортежей (дисциплина, оценка релевантности)
+        """
+        if not self.use_vector_search:
+            return {user_id: self._recommend_courses_classic(user_id, program_id, limit)
+                    for user_id in user_ids}
+        
+        recommendations = {user_id: [] for user_id in user_ids}
+        program = self.db.get_program(program_id)
+        if not program:
+            return recommendations
+        
+        vectors = self._profile_vectors_for(user_ids)
+        if not vectors:
+            return recommendations
+        
+        try:
+            batch_results = self.vector_db.search_courses_batch(
+                np.stack(list(vectors.values())).tolist(),
+                program_id=program_id,
+                limit=limit,
+                with_payload=["name"]
+            )
+        except Exception:
+            logger.exception("Ошибка при пакетном поиске рекомендаций")
+            return recommendations
         
+        courses_by_name = self._courses_by_name(program)
+        for user_id, vector_results in zip(vectors, batch_results):
+            recommendations[user_id] = self._match_courses(courses_by_name, vector_results)
+        return recommendations
+    
+    @staticmethod
+    def _courses_by_name(program: MasterProgram) -> Dict[str, Course]:
+        """Словарь название -> дисциплина программы (первая при совпадении названий)"""
+        courses_by_name = {}
+        for course in program.courses:
+            courses_by_name.setdefault(course.name, course)
+        return courses_by_name
+    
+    @staticmethod
+    def _match_courses(courses_by_name: Dict[str, Course],
+                       vector_results: List[Dict]) -> List[Tuple[Course, float]]:
+        """Преобразует результаты векторного поиска в кортежи (дисциплина, оценка)"""
+        recommendations = []
+        for result in vector_results:
+            course = courses_by_name.get(result.get("name"))
+            if course is not None:
+                recommendations.append((course, result.get("score", 0.0)))
         return recommendations
     
     def _recommend_courses_classic(self, user_id: int, program_id: str,
@@ -150,56 +359,45 @@ class CourseRecommender:
         # Получаем выборные дисциплины
         elective_courses = self.db.get_elective_courses(program_id)
         
-        # Вычисляем релевантность для каждой дисциплины
-        recommendations = []
-        for course in elective_courses:
-            score = self._calculate_relevance(course, profile_data, program)
-            recommendations.append((course, score))
-        
-        # Сортируем по убыванию релевантности
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        
-        return recommendations[:limit]
+        # Термины профиля и навыки программы с весами - в нижнем регистре
+        # один раз для всех дисциплин
+        profile = self._lower_profile(profile_data)
+        terms = [
+            *((interest, 0.3) for interest in profile['interests']),
+            *((goal, 0.25) for goal in profile['goals']),
+            *((skill.lower(), 0.15) for skill in program.skills),
+            *((bg, 0.1) for bg in profile['background']),
+        ]
+        
+        # Отбираем limit лучших по убыванию релевантности без полной сортировки
+        # и без промежуточного списка всех оценок
+        scored = ((course, self._calculate_relevance(course, terms)) for course in elective_courses)
+        return heapq.nlargest(limit, scored, key=lambda x: x[1])
     
-    def _calculate_relevance(self, course: Course, profile: Dict, 
-                           program: MasterProgram) -> float:
+    @staticmethod
+    def _lower_profile(profile: Dict) -> Dict[str, List[str]]:
+        """Приводит списки профиля (интересы, цели, бэкграунд) к нижнему регистру"""
+        return {
+            key: [value.lower() for value in profile.get(key) or ()]
+            for key in ('interests', 'goals', 'background')
+        }
+    
+    def _calculate_relevance(self, course: Course, terms: List[Tuple[str, float]]) -> float:
         """
         Вычисляет релевантность дисциплины для пользователя
         
         Args:
             course: Дисциплина
-            profile: Профиль пользователя
-            program: Программа обучения
+            terms: Пары (термин в нижнем регистре, вес): интересы и цели
+                пользователя, навыки программы и бэкграунд пользователя
             
         Returns:
             Оценка релевантности от 0 до 1
         """
-        score = 0.0
         course_text = (course.name + " " + course.description).lower()
         
-        # Проверяем совпадение с интересами
-        interests = profile.get('interests', [])
-        for interest in interests:
-            if interest.lower() in course_text:
-                score += 0.3
-        
-        # Проверяем совпадение с целями
-        goals = profile.get('goals', [])
-        for goal in goals:
-            if goal.lower() in course_text:
-                score += 0.25
-        
-        # Проверяем совпадение с навыками программы
-        for skill in program.skills:
-            if skill.lower() in course_text:
-                score += 0.15
-        
-        # Проверяем бэкграунд - если дисциплина дополняет знания
-        background = profile.get('background', [])
-        for bg in background:
-            # Если дисциплина развивает существующие знания
-            if bg.lower() in course_text:
-                score += 0.1
+        # Каждый термин, встречающийся в тексте дисциплины, добавляет свой вес
+        score = sum(weight for term, weight in terms if term in course_text)
         
         # Нормализуем оценку
         return min(score, 1.0)
@@ -231,20 +429,30 @@ class CourseRecommender:
         Returns:
             Список кортежей (программа, оценка соответствия)
         """
+        profile_vector = self._profile_vector(user_id)
+        if profile_vector is None:
+            return []
+        
         # Получаем рекомендации из векторной базы
-        vector_results = self.vector_db.recommend_programs_for_user(
-            user_id=user_id,
-            limit=10
-        )
+        try:
+            vector_results = self.vector_db.search_programs(
+                profile_vector.tolist(),
+                limit=self.PROGRAM_RECOMMENDATION_LIMIT,
+                with_payload=["program_id"]
+            )
+        except Exception:
+            logger.exception("Ошибка при поиске рекомендаций программ")
+            return []
         
         # Преобразуем результаты в формат (MasterProgram, float)
         recommendations = []
         for result in vector_results:
-            program_id = result.get("id")
+            # ID точки - UUID, ID программы хранится в payload
+            program_id = result.get("program_id")
             score = result.get("score", 0.0)
             
             # Получаем объект MasterProgram из базы данных
-            program = self.db.get_program(program_id)
+            program = self.db.get_program(program_id) if program_id else None
             if program:
                 recommendations.append((program, score))
         
@@ -264,17 +472,14 @@ class CourseRecommender:
         if not profile_data:
             return []
         
-        programs = self.db.get_all_programs()
-        recommendations = []
-        
-        for program in programs:
-            score = self._calculate_program_match(program, profile_data)
-            recommendations.append((program, score))
-        
-        # Сортируем по убыванию соответствия
-        recommendations.sort(key=lambda x: x[1], reverse=True)
+        profile = self._lower_profile(profile_data)
         
-        return recommendations
+        # Оценки вычисляются по мере обхода каталога, в памяти остаются только лучшие
+        scored = (
+            (program, self._calculate_program_match(program, profile))
+            for program in self.db.get_all_programs()
+        )
+        return heapq.nlargest(self.PROGRAM_RECOMMENDATION_LIMIT, scored, key=lambda x: x[1])
     
     def _calculate_program_match(self, program: MasterProgram, 
                                 profile: Dict) -> float:
@@ -283,39 +488,68 @@ class CourseRecommender:
         
         Args:
             program: Магистерская программа
-            profile: Профиль пользователя
+            profile: Профиль пользователя в нижнем регистре (см. _lower_profile)
             
         Returns:
             Оценка соответствия от 0 до 1
         """
         score = 0.0
+        program_text, career_text, requirements = self._program_texts_for(program)
         
         # Проверяем совпадение навыков программы с интересами
-        interests = profile.get('interests', [])
-        program_text = program.description.lower() + " " + " ".join(program.skills).lower()
-        
-        for interest in interests:
-            if interest.lower() in program_text:
+        for interest in profile['interests']:
+            if interest in program_text:
                 score += 0.2
         
         # Проверяем совпадение с карьерными целями
-        goals = profile.get('goals', [])
-        career_text = " ".join(program.career).lower()
-        
-        for goal in goals:
-            if goal.lower() in career_text:
+        for goal in profile['goals']:
+            if goal in career_text:
                 score += 0.3
         
         # Проверяем соответствие бэкграунда требованиям
-        background = profile.get('background', [])
-        for req in program.requirements:
+        background = profile['background']
+        for req in requirements:
             for bg in background:
-                if bg.lower() in req.lower():
+                if bg in req:
                     score += 0.15
         
         # Нормализуем оценку
         return min(score, 1.0)
     
+    def _program_texts_for(self, program: MasterProgram) -> Tuple[str, str, List[str]]:
+        """
+        Возвращает тексты программы в нижнем регистре для классического скоринга
+        
+        Тексты вычисляются один раз на объект программы; после перезагрузки
+        каталога (новый объект программы) вычисляются заново.
+        
+        Returns:
+            Кортеж (описание и навыки, карьера, требования)
+        """
+        entry = self._program_texts.get(program.id)
+        if entry is None or entry[0] is not program:
+            entry = (
+                program,
+                program.description.lower() + " " + " ".join(program.skills).lower(),
+                " ".join(program.career).lower(),
+                [req.lower() for req in program.requirements]
+            )
+            self._program_texts[program.id] = entry
+        return entry[1:]
+    
+    def _mandatory_courses_for(self, program: MasterProgram) -> Tuple[Course, ...]:
+        """
+        Возвращает первые 10 обязательных дисциплин программы для учебного плана
+        
+        Список вычисляется один раз на объект программы (см. _program_texts_for).
+        """
+        entry = self._mandatory_courses.get(program.id)
+        if entry is None or entry[0] is not program:
+            mandatory = tuple(c for c in program.courses if c.type_enum is CourseType.MANDATORY)[:10]
+            entry = (program, mandatory)
+            self._mandatory_courses[program.id] = entry
+        return entry[1]
+    
     def get_study_plan(self, user_id: int, program_id: str) -> str:
         """
         Формирует рекомендованный учебный план
@@ -333,103 +567,131 @@ class CourseRecommender:
         
         profile_data = self.db.get_user_profile(user_id)
         
-        plan = f"📋 Рекомендованный учебный план: {program.title}\n\n"
+        # План зависит от содержимого профиля и версии программы: изменение
+        # профиля дает новый ключ, перезагрузка каталога - новый объект программы
+        cache_key = (user_id, program_id, *(
+            tuple(profile_data.get(key) or ()) for key in ('background', 'interests', 'skills', 'goals')
+        ))
+        now = time.monotonic()
+        with self._study_plans_lock:
+            entry = self._study_plans.get(cache_key)
+            if entry is not None and entry[1] is program and now - entry[0] <= self.STUDY_PLAN_CACHE_TTL:
+                self._study_plans.move_to_end(cache_key)
+                return entry[2]
+        
+        plan = self._build_study_plan(user_id, program, profile_data)
+        
+        with self._study_plans_lock:
+            self._study_plans[cache_key] = (now, program, plan)
+            self._study_plans.move_to_end(cache_key)
+            while len(self._study_plans) > self.STUDY_PLAN_CACHE_SIZE:
+                self._study_plans.popitem(last=False)
+        return plan
+    
+    def _build_study_plan(self, user_id: int, program: MasterProgram, profile_data: Dict) -> str:
+        """Формирует текст учебного плана"""
+        program_id = program.id
+        parts = [f"📋 Рекомендованный учебный план: {program.title}\n\n"]
         
         # Обязательные дисциплины
-        mandatory = [c for c in program.courses if 'обяз' in c.type.lower()]
+        mandatory = self._mandatory_courses_for(program)
         if mandatory:
-            plan += "📌 Обязательные дисциплины:\n"
-            for course in mandatory[:10]:
-                plan += f"  • {course.name} ({course.semester} семестр)\n"
-            plan += "\n"
+            parts.append("📌 Обязательные дисциплины:\n")
+            for course in mandatory:
+                parts.append(f"  • {course.name} ({course.semester} семестр)\n")
+            parts.append("\n")
         
         # Рекомендованные выборные дисциплины
         recommended = self.recommend_courses(user_id, program_id, limit=5)
         if recommended:
-            plan += "⭐ Рекомендованные выборные дисциплины:\n"
+            parts.append("⭐ Рекомендованные выборные дисциплины:\n")
             for course, score in recommended:
-                plan += f"  • {course.name} (релевантность: {score:.0%})\n"
-            plan += "\n"
+                relevance = f"{score:.0%}"
+                parts.append(f"  • {course.name} (релевантность: {relevance})\n")
+            parts.append("\n")
         
         # Советы по обучению
-        plan += "💡 Рекомендации по обучению:\n"
+        parts.append("💡 Рекомендации по обучению:\n")
         if profile_data:
             interests = profile_data.get('interests', [])
             if interests:
-                plan += f"  • Фокусируйтесь на дисциплинах, связанных с: {', '.join(interests[:3])}\n"
+                parts.append(f"  • Фокусируйтесь на дисциплинах, связанных с: {', '.join(interests[:3])}\n")
             
             goals = profile_data.get('goals', [])
             if goals:
-                plan += f"  • Для достижения целей ({', '.join(goals[:2])}) выбирайте соответствующие элективы\n"
+                parts.append(f"  • Для достижения целей ({', '.join(goals[:2])}) выбирайте соответствующие элективы\n")
         
-        return plan
+        return "".join(parts)
     
     def format_recommendations(self, recommendations: List[Tuple[Course, float]]) -> str:
         """Форматирует рекомендации для вывода"""
         if not recommendations:
             return "Нет рекомендаций"
         
-        result = "🎯 Рекомендованные дисциплины:\n\n"
+        parts = ["🎯 Рекомендованные дисциплины:\n\n"]
         for i, (course, score) in enumerate(recommendations, 1):
-            result += f"{i}. {course.name}\n"
-            result += f"   Релевантность: {score:.0%}\n"
+            relevance = f"{score:.0%}"
+            parts.append(f"{i}. {course.name}\n")
+            parts.append(f"   Релевантность: {relevance}\n")
             if course.description:
-                result += f"   {course.description[:100]}...\n"
-            result += "\n"
+                parts.append(f"   {course.description[:100]}...\n")
+            parts.append("\n")
         
-        return result
+        return "".join(parts)
+    
+    def _iter_courses(self, program_id: str = None) -> Iterator[Dict]:
+        """
+        Перебирает дисциплины для индексации в векторной базе
+        
+        Args:
+            program_id: ID программы (по умолчанию - все программы)
+            
+        Yields:
+            Словари дисциплин в формате QdrantVectorDB.add_courses_batch
+        """
+        if program_id:
+            program = self.db.get_program(program_id)
+            programs = (program,) if program else ()
+        else:
+            programs = self.db.get_all_programs()
+        
+        for program in programs:
+            for course in program.courses:
+                yield {
+                    "course_id": f"{program.id}/{course.name}",
+                    "program_id": program.id,
+                    "name": course.name,
+                    "description": course.description,
+                    "metadata": {
+                        "type": course.type,
+                        "semester": course.semester
+                    }
+                }
     
     def index_courses(self, program_id: str = None) -> int:
         """
         Индексирует дисциплины в векторную базу
         
+        Дисциплины загружаются пакетами по INDEX_BATCH_SIZE, до INDEX_WORKERS
+        пакетов обрабатываются одновременно.
+        
         Args:
             program_id: ID программы для индексации (опционально)
             
         Returns:
             Количество проиндексированных дисциплин
         """
+        self._mandatory_courses.clear()
         if not self.use_vector_search:
             return 0
         
-        count = 0
-        
+        courses = self._iter_courses(program_id)
         if program_id:
-            # Индексируем дисциплины одной программы
-            program = self.db.get_program(program_id)
-            if program:
-                for course in program.courses:
-                    success = self.vector_db.add_course(
-                        course_id=f"{program_id}_{course.name}",
-                        program_id=program_id,
-                        name=course.name,
-                        description=course.description,
-                        metadata={
-                            "type": course.type,
-                            "semester": course.semester
-                        }
-                    )
-                    if success:
-                        count += 1
-        else:
-            # Индексируем все дисциплины
-            programs = self.db.get_all_programs()
-            for program in programs:
-                for course in program.courses:
-                    success = self.vector_db.add_course(
-                        course_id=f"{program.program_id}_{course.name}",
-                        program_id=program.program_id,
-                        name=course.name,
-                        description=course.description,
-                        metadata={
-                            "type": course.type,
-                            "semester": course.semester
-                        }
-                    )
-                    if success:
-                        count += 1
+            return self._index_batches(courses, self.vector_db.add_courses_batch)
         
-        return count
+        # Полная переиндексация: HNSW-индекс строится один раз после загрузки
+        with self.vector_db.bulk_upload(QdrantVectorDB.COURSES_COLLECTION):
+            return self._index_batches(courses, self.vector_db.add_courses_batch)
     
     def index_programs(self) -> int:
         """
@@ -438,26 +700,50 @@ class CourseRecommender:
         Returns:
             Количество проиндексированных программ
         """
+        self._program_texts.clear()
         if not self.use_vector_search:
             return 0
         
-        count = 0
-        programs = self.db.get_all_programs()
-        
-        for program in programs:
-            success = self.vector_db.add_program(
-                program_id=program.program_id,
-                title=program.title,
-                description=program.description,
-                skills=program.skills,
-                career=program.career,
-                metadata={
+        programs = (
+            {
+                "program_id": program.id,
+                "title": program.title,
+                "description": program.description,
+                "skills": program.skills,
+                "career": program.career,
+                "metadata": {
                     "requirements": program.requirements
                 }
-            )
-            if success:
-                count += 1
+            }
+            for program in self.db.get_all_programs()
+        )
+        with self.vector_db.bulk_upload(QdrantVectorDB.PROGRAMS_COLLECTION):
+            return self._index_batches(programs, self.vector_db.add_programs_batch)
+    
+    def _index_batches(self, items: Iterator[Dict], add_batch: Callable[[List[Dict]], int]) -> int:
+        """
+        Загружает элементы в векторную базу пакетами по INDEX_BATCH_SIZE
         
+        Пакеты обрабатываются в пуле из INDEX_WORKERS потоков: пока один пакет
+        загружается в Qdrant, следующий кодируется моделью. Пакетов в работе
+        не больше INDEX_WORKERS, поэтому элементы читаются по мере загрузки.
+        
+        Args:
+            items: Элементы для индексации
+            add_batch: Метод векторной базы для загрузки пакета
+            
+        Returns:
+            Количество загруженных элементов
+        """
+        count = 0
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.INDEX_WORKERS) as executor:
+            while batch := list(itertools.islice(items, self.INDEX_BATCH_SIZE)):
+                if len(pending) >= self.INDEX_WORKERS:
+                    count += pending.popleft().result()
+                pending.append(executor.submit(add_batch, batch))
+            while pending:
+                count += pending.popleft().result()
         return count
 
 
@@ -1,23 +1,69 @@
 """
 Модуль для работы с векторной базой данных Qdrant
 """
-from typing import List, Dict, Optional, Tuple, Any
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple, Any, Union
 from dataclasses import dataclass
 import os
+import numpy as np
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
+    Datatype,
     Distance,
     VectorParams,
     PointStruct,
+    Batch,
     Filter,
     FieldCondition,
     MatchValue,
-    SearchRequest,
-    FilterSelector
+    QueryRequest,
+    SearchParams,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    ScalarQuantizationConfig,
+    ScalarType,
+    FilterSelector,
+    OptimizersConfigDiff,
+    PayloadSchemaType,
+    ScoredPoint
 )
 from src.embeddings import EmbeddingModel, get_embedding_model
 
 
+logger = logging.getLogger(__name__)
+
+
+# Поля payload, возвращаемые отдельно от метаданных (описаний в payload нет:
+# полные тексты берутся из каталога MongoDB по program_id и названию)
+_COURSE_PAYLOAD_KEYS = frozenset({"name", "program_id"})
+_PROGRAM_PAYLOAD_KEYS = frozenset({"program_id", "title", "skills", "career"})
+
+# Пространство имен для ID точек дисциплин и программ
+_POINT_ID_NAMESPACE = uuid.UUID("0b672b72-f467-442c-9e5b-e73dc74d0ced")
+
+
+def point_id(key: str) -> str:
+    """
+    Вычисляет ID точки Qdrant по строковому ключу
+    
+    Qdrant принимает в качестве ID только целые числа без знака и UUID,
+    поэтому строковые ключи детерминированно переводятся в UUID (uuid5).
+    
+    Args:
+        key: Строковый ключ (например, "ai" или "ai/Машинное обучение")
+        
+    Returns:
+        UUID точки в строковом виде
+    """
+    return str(uuid.uuid5(_POINT_ID_NAMESPACE, key))
+
+
 @dataclass
 class CourseVector:
     """Векторное представление дисциплины"""
@@ -47,8 +93,30 @@ class QdrantVectorDB:
     PROGRAMS_COLLECTION = "programs"
     PROFILES_COLLECTION = "user_profiles"
     
+    # gRPC-порт Qdrant и таймаут запросов (в секундах)
+    GRPC_PORT = 6334
+    TIMEOUT = 30
+    
+    # Коллекция программ до LOCAL_INDEX_MAX_SIZE точек ищется по локальной
+    # копии (перечитывается раз в LOCAL_INDEX_TTL секунд)
+    LOCAL_INDEX_MAX_SIZE = 50000
+    LOCAL_INDEX_TTL = 600
+    
+    # Число запросов в одном пакетном поиске
+    SEARCH_BATCH_SIZE = 16
+    
+    # Поиск по квантованным векторам: кандидатов берется в QUANTIZATION_OVERSAMPLING
+    # раз больше limit, затем они пересчитываются по исходным векторам
+    QUANTIZATION_OVERSAMPLING = 2.0
+    
+    # Размер списка кандидатов при обходе HNSW-графа (больше - точнее, но медленнее)
+    HNSW_EF = 64
+    
+    # Порог индексации Qdrant по умолчанию (восстанавливается после массовой загрузки)
+    DEFAULT_INDEXING_THRESHOLD = 20000
+    
     def __init__(self, url: str = None, api_key: str = None, 
-                 embedding_model: EmbeddingModel = None):
+                 embedding_model: EmbeddingModel = None, hnsw_ef: int = None):
         """
         Инициализация подключения к Qdrant
         
@@ -56,54 +124,92 @@ class QdrantVectorDB:
             url: URL Qdrant сервера (по умолчанию localhost:6333)
             api_key: API ключ для Qdrant Cloud (опционально)
             embedding_model: Модель эмбеддингов
+            hnsw_ef: Параметр ef поиска по HNSW (по умолчанию из QDRANT_HNSW_EF или HNSW_EF)
         """
         self.url = url or os.getenv("QDRANT_URL", "http://localhost:6333")
         self.api_key = api_key or os.getenv("QDRANT_API_KEY")
+        self.hnsw_ef = hnsw_ef or int(os.getenv("QDRANT_HNSW_EF") or self.HNSW_EF)
         
-        # Инициализация клиента Qdrant
-        self.client = QdrantClient(
+        # Инициализация клиента Qdrant: векторы передаются по gRPC в бинарном
+        # виде protobuf, а не JSON-массивами (QDRANT_PREFER_GRPC=false - REST)
+        client_kwargs = dict(
             url=self.url,
-            api_key=self.api_key
+            api_key=self.api_key,
+            prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "true").lower() != "false",
+            grpc_port=int(os.getenv("QDRANT_GRPC_PORT") or self.GRPC_PORT),
+            timeout=self.TIMEOUT
         )
+        self.client = QdrantClient(**client_kwargs)
         
         # Инициализация модели эмбеддингов
         self.embedding_model = embedding_model or get_embedding_model()
         self.embedding_dim = self.embedding_model.embedding_dim
         
+        # Параметры поиска (для неквантованных коллекций параметры квантования игнорируются)
+        self.search_params = SearchParams(
+            hnsw_ef=self.hnsw_ef,
+            exact=False,
+            quantization=QuantizationSearchParams(
+                ignore=False,
+                rescore=True,
+                oversampling=self.QUANTIZATION_OVERSAMPLING
+            )
+        )
+        
+        # Локальная копия коллекции программ (см. _local_program_index)
+        self._program_index: Optional[Tuple[List[Any], List[Dict[str, Any]], np.ndarray]] = None
+        self._program_index_loaded_at: Optional[float] = None
+        self._program_index_lock = threading.Lock()
+        
         # Создаем коллекции при инициализации
         self._ensure_collections_exist()
     
     def _ensure_collections_exist(self):
         """Создает коллекции, если они не существуют"""
-        # Коллекция для дисциплин
-        if not self.client.collection_exists(self.COURSES_COLLECTION):
-            self.client.create_collection(
-                collection_name=self.COURSES_COLLECTION,
-                vectors_config=VectorParams(
-                    size=self.embedding_dim,
-                    distance=Distance.COSINE
-                )
+        # Векторы дисциплин и программ хранятся со скалярным квантованием (int8)
+        # в оперативной памяти: поиск идет по int8, а кандидаты пересчитываются
+        # по исходным векторам
+        scalar_quantization = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
             )
+        )
+        # По профилям не ищут (рекомендации строятся по профилю из MongoDB),
+        # поэтому для них достаточно бинарного квантования (1 бит на измерение)
+        binary_quantization = BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        )
         
-        # Коллекция для программ
-        if not self.client.collection_exists(self.PROGRAMS_COLLECTION):
-            self.client.create_collection(
-                collection_name=self.PROGRAMS_COLLECTION,
-                vectors_config=VectorParams(
-                    size=self.embedding_dim,
-                    distance=Distance.COSINE
+        collections = {
+            self.COURSES_COLLECTION: scalar_quantization,
+            self.PROGRAMS_COLLECTION: scalar_quantization,
+            self.PROFILES_COLLECTION: binary_quantization,
+        }
+        for collection_name, quantization_config in collections.items():
+            if not self.client.collection_exists(collection_name):
+                self.client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=VectorParams(
+                        size=self.embedding_dim,
+                        # Векторы нормализуются моделью эмбеддингов, поэтому скалярное
+                        # произведение равно косинусу и не требует нормировки при поиске
+                        distance=Distance.DOT,
+                        # Исходные векторы хранятся в половинной точности
+                        datatype=Datatype.FLOAT16
+                    ),
+                    quantization_config=quantization_config
                 )
-            )
         
-        # Коллекция для профилей пользователей
-        if not self.client.collection_exists(self.PROFILES_COLLECTION):
-            self.client.create_collection(
-                collection_name=self.PROFILES_COLLECTION,
-                vectors_config=VectorParams(
-                    size=self.embedding_dim,
-                    distance=Distance.COSINE
-                )
-            )
+        # Индекс по программе: фильтр по program_id учитывается при обходе
+        # HNSW-графа, а не проверкой каждого кандидата (создание идемпотентно,
+        # поэтому индекс появится и в уже существующей коллекции)
+        self.client.create_payload_index(
+            collection_name=self.COURSES_COLLECTION,
+            field_name="program_id",
+            field_schema=PayloadSchemaType.KEYWORD
+        )
     
     def add_course(self, course_id: str, program_id: str, name: str,
                   description: str, metadata: Dict[str, Any] = None) -> bool:
@@ -111,40 +217,22 @@ class QdrantVectorDB:
         Добавляет дисциплину в векторную базу
         
         Args:
-            course_id: ID дисциплины
+            course_id: Ключ дисциплины (ID точки вычисляется по нему, см. point_id)
             program_id: ID программы
             name: Название дисциплины
             description: Описание дисциплины
             metadata: Дополнительные метаданные
             
         Returns:
-            True если успешно, иначе False
+            True, если дисциплина добавлена (ошибки Qdrant и модели пробрасываются)
         """
-        try:
-            # Получаем эмбеддинг
-            embedding = self.embedding_model.encode_course(name, description)
-            
-            # Создаем точку
-            point = PointStruct(
-                id=course_id,
-                vector=embedding.tolist(),
-                payload={
-                    "program_id": program_id,
-                    "name": name,
-                    "description": description,
-                    **(metadata or {})
-                }
-            )
-            
-            # Добавляем в коллекцию
-            self.client.upsert(
-                collection_name=self.COURSES_COLLECTION,
-                points=[point]
-            )
-            return True
-        except Exception as e:
-            print(f"Ошибка при добавлении дисциплины: {e}")
-            return False
+        return self.add_courses_batch([{
+            "course_id": course_id,
+            "program_id": program_id,
+            "name": name,
+            "description": description,
+            "metadata": metadata
+        }]) == 1
     
     def add_program(self, program_id: str, title: str, description: str,
                    skills: List[str], career: List[str],
@@ -161,36 +249,132 @@ class QdrantVectorDB:
             metadata: Дополнительные метаданные
             
         Returns:
-            True если успешно, иначе False
+            True, если программа добавлена (ошибки Qdrant и модели пробрасываются)
+        """
+        return self.add_programs_batch([{
+            "program_id": program_id,
+            "title": title,
+            "description": description,
+            "skills": skills,
+            "career": career,
+            "metadata": metadata
+        }]) == 1
+    
+    @contextmanager
+    def bulk_upload(self, collection_name: str):
         """
+        Контекст массовой загрузки в коллекцию
+        
+        На время загрузки построение HNSW-индекса отключается (indexing_threshold=0),
+        чтобы Qdrant не перестраивал граф после каждого пакета; после выхода
+        порог восстанавливается и индекс строится один раз.
+        
+        Args:
+            collection_name: Название коллекции
+        """
+        info = self.client.get_collection(collection_name)
+        indexing_threshold = info.config.optimizer_config.indexing_threshold
+        if indexing_threshold is None:
+            indexing_threshold = self.DEFAULT_INDEXING_THRESHOLD
+        
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=OptimizersConfigDiff(indexing_threshold=0)
+        )
         try:
-            # Получаем эмбеддинг
-            embedding = self.embedding_model.encode_program(
-                title, description, skills, career
+            yield
+        finally:
+            self.client.update_collection(
+                collection_name=collection_name,
+                optimizer_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold)
             )
+    
+    def add_courses_batch(self, courses: List[Dict[str, Any]]) -> int:
+        """
+        Добавляет пакет дисциплин в векторную базу
+        
+        Эмбеддинги всех дисциплин вычисляются одним вызовом модели,
+        точки загружаются одним запросом upsert. Описание участвует только
+        в эмбеддинге: в payload его нет, полный текст хранится в MongoDB.
+        
+        Args:
+            courses: Дисциплины - словари с ключами course_id (ключ для point_id), program_id,
+                name, description и (опционально) metadata
             
-            # Создаем точку
-            point = PointStruct(
-                id=program_id,
-                vector=embedding.tolist(),
-                payload={
-                    "title": title,
-                    "description": description,
-                    "skills": skills,
-                    "career": career,
-                    **(metadata or {})
+        Returns:
+            Количество добавленных дисциплин
+        """
+        if not courses:
+            return 0
+        embeddings = self.embedding_model.batch_encode([
+            self.embedding_model.course_text(course["name"], course["description"])
+            for course in courses
+        ])
+        
+        # Пакет точек - один объект Batch вместо отдельного PointStruct на дисциплину;
+        # матрица эмбеддингов переводится в списки одним вызовом
+        batch = Batch(
+            ids=[point_id(course["course_id"]) for course in courses],
+            vectors=embeddings.tolist(),
+            payloads=[
+                {
+                    "program_id": course["program_id"],
+                    "name": course["name"],
+                    **(course.get("metadata") or {})
                 }
-            )
+                for course in courses
+            ]
+        )
+        
+        self.client.upsert(
+            collection_name=self.COURSES_COLLECTION,
+            points=batch
+        )
+        return len(courses)
+    
+    def add_programs_batch(self, programs: List[Dict[str, Any]]) -> int:
+        """
+        Добавляет пакет программ в векторную базу
+        
+        Описание, как и у дисциплин, в payload не сохраняется.
+        
+        Args:
+            programs: Программы - словари с ключами program_id, title,
+                description, skills, career и (опционально) metadata
             
-            # Добавляем в коллекцию
-            self.client.upsert(
-                collection_name=self.PROGRAMS_COLLECTION,
-                points=[point]
+        Returns:
+            Количество добавленных программ
+        """
+        if not programs:
+            return 0
+        embeddings = self.embedding_model.batch_encode([
+            self.embedding_model.program_text(
+                program["title"], program["description"], program["skills"], program["career"]
             )
-            return True
-        except Exception as e:
-            print(f"Ошибка при добавлении программы: {e}")
-            return False
+            for program in programs
+        ])
+        
+        batch = Batch(
+            ids=[point_id(program["program_id"]) for program in programs],
+            vectors=embeddings.tolist(),
+            payloads=[
+                {
+                    "program_id": program["program_id"],
+                    "title": program["title"],
+                    "skills": program["skills"],
+                    "career": program["career"],
+                    **(program.get("metadata") or {})
+                }
+                for program in programs
+            ]
+        )
+        
+        self.client.upsert(
+            collection_name=self.PROGRAMS_COLLECTION,
+            points=batch
+        )
+        self._invalidate_local_program_index()
+        return len(programs)
     
     def add_user_profile(self, user_id: int, background: List[str],
                         interests: List[str], skills: List[str],
@@ -206,39 +390,36 @@ class QdrantVectorDB:
             goals: Карьерные цели
             
         Returns:
-            True если успешно, иначе False
+            True, если профиль добавлен (ошибки Qdrant и модели пробрасываются)
         """
-        try:
-            # Получаем эмбеддинг
-            embedding = self.embedding_model.encode_user_profile(
-                background, interests, skills, goals
-            )
-            
-            # Создаем точку
-            point = PointStruct(
-                id=str(user_id),
-                vector=embedding.tolist(),
-                payload={
-                    "background": background,
-                    "interests": interests,
-                    "skills": skills,
-                    "goals": goals
-                }
-            )
-            
-            # Добавляем в коллекцию
-            self.client.upsert(
-                collection_name=self.PROFILES_COLLECTION,
-                points=[point]
-            )
-            return True
-        except Exception as e:
-            print(f"Ошибка при добавлении профиля пользователя: {e}")
-            return False
+        # Получаем эмбеддинг
+        embedding = self.embedding_model.encode_user_profile(
+            background, interests, skills, goals
+        )
+        
+        # Создаем точку
+        point = PointStruct(
+            id=user_id,
+            vector=embedding.tolist(),
+            payload={
+                "background": background,
+                "interests": interests,
+                "skills": skills,
+                "goals": goals
+            }
+        )
+        
+        # Добавляем в коллекцию
+        self.client.upsert(
+            collection_name=self.PROFILES_COLLECTION,
+            points=[point]
+        )
+        return True
     
     def search_courses(self, query_embedding: List[float], 
                       program_id: str = None, limit: int = 5,
-                      score_threshold: float = 0.0) -> List[Dict[str, Any]]:
+                      score_threshold: float = 0.0,
+                      with_payload: Union[bool, List[str]] = True) -> List[Dict[str, Any]]:
         """
         Ищет похожие дисциплины
         
@@ -247,49 +428,101 @@ class QdrantVectorDB:
             program_id: ID программы для фильтрации (опционально)
             limit: Максимальное количество результатов
             score_threshold: Минимальный порог схожести
+            with_payload: Какие поля payload загружать (True - все, False - никакие)
             
         Returns:
             Список найденных дисциплин с оценками
         """
         # Создаем фильтр по программе если указан
-        query_filter = None
-        if program_id:
-            query_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="program_id",
-                        match=MatchValue(value=program_id)
-                    )
-                ]
-            )
+        query_filter = self._program_filter(program_id)
         
         # Выполняем поиск
-        results = self.client.search(
+        results = self.client.query_points(
             collection_name=self.COURSES_COLLECTION,
-            query_vector=query_embedding,
+            query=query_embedding,
             query_filter=query_filter,
             limit=limit,
-            score_threshold=score_threshold
-        )
+            score_threshold=score_threshold,
+            search_params=self.search_params,
+            with_payload=with_payload
+        ).points
+        
+        return [self._format_course(result) for result in results]
+    
+    def search_courses_batch(self, query_embeddings: List[List[float]],
+                             program_id: str = None, limit: int = 5,
+                             score_threshold: float = 0.0,
+                             with_payload: Union[bool, List[str]] = True) -> List[List[Dict[str, Any]]]:
+        """
+        Ищет похожие дисциплины для нескольких запросов
+        
+        Запросы отправляются пакетами по SEARCH_BATCH_SIZE с общим фильтром.
+        
+        Args:
+            query_embeddings: Эмбеддинги запросов
+            program_id: ID программы для фильтрации (опционально)
+            limit: Максимальное количество результатов на запрос
+            score_threshold: Минимальный порог схожести
+            with_payload: Какие поля payload загружать (True - все, False - никакие)
+            
+        Returns:
+            Списки найденных дисциплин в порядке запросов
+        """
+        query_filter = self._program_filter(program_id)
         
-        # Форматируем результаты
         formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "id": result.id,
-                "score": result.score,
-                "name": result.payload.get("name"),
-                "description": result.payload.get("description"),
-                "program_id": result.payload.get("program_id"),
-                "metadata": {k: v for k, v in result.payload.items() 
-                           if k not in ["name", "description", "program_id"]}
-            })
+        for start in range(0, len(query_embeddings), self.SEARCH_BATCH_SIZE):
+            requests = [
+                QueryRequest(
+                    query=embedding,
+                    filter=query_filter,
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    with_payload=with_payload,
+                    params=self.search_params
+                )
+                for embedding in query_embeddings[start:start + self.SEARCH_BATCH_SIZE]
+            ]
+            batch = self.client.query_batch_points(
+                collection_name=self.COURSES_COLLECTION,
+                requests=requests
+            )
+            formatted_results.extend(
+                [self._format_course(result) for result in response.points] for response in batch
+            )
         
         return formatted_results
     
+    @staticmethod
+    def _program_filter(program_id: Optional[str]) -> Optional[Filter]:
+        """Фильтр дисциплин по программе (None, если программа не указана)"""
+        if not program_id:
+            return None
+        return Filter(
+            must=[
+                FieldCondition(
+                    key="program_id",
+                    match=MatchValue(value=program_id)
+                )
+            ]
+        )
+    
+    @staticmethod
+    def _format_course(result) -> Dict[str, Any]:
+        """Преобразует найденную точку дисциплины в словарь"""
+        payload = result.payload or {}
+        return {
+            "id": result.id,
+            "score": result.score,
+            "name": payload.get("name"),
+            "program_id": payload.get("program_id"),
+            "metadata": {k: v for k, v in payload.items() if k not in _COURSE_PAYLOAD_KEYS}
+        }
+    
     def search_programs(self, query_embedding: List[float],
                        limit: int = 5, 
-                       score_threshold: float = 0.0) -> List[Dict[str, Any]]:
+                       score_threshold: float = 0.0,
+                       with_payload: Union[bool, List[str]] = True) -> List[Dict[str, Any]]:
         """
         Ищет похожие программы
         
@@ -297,101 +530,125 @@ class QdrantVectorDB:
             query_embedding: Эмбеддинг запроса
             limit: Максимальное количество результатов
             score_threshold: Минимальный порог схожести
+            with_payload: Какие поля payload загружать (True - все, False - никакие)
             
         Returns:
             Список найденных программ с оценками
         """
+        # Небольшая коллекция ищется полным перебором по локальной копии
+        local_index = self._local_program_index()
+        if local_index is not None:
+            return self._search_local_programs(
+                local_index, query_embedding, limit, score_threshold, with_payload
+            )
+        
         # Выполняем поиск
-        results = self.client.search(
+        results = self.client.query_points(
             collection_name=self.PROGRAMS_COLLECTION,
-            query_vector=query_embedding,
+            query=query_embedding,
             limit=limit,
-            score_threshold=score_threshold
-        )
+            score_threshold=score_threshold,
+            search_params=self.search_params,
+            with_payload=with_payload
+        ).points
         
-        # Форматируем результаты
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "id": result.id,
-                "score": result.score,
-                "title": result.payload.get("title"),
-                "description": result.payload.get("description"),
-                "skills": result.payload.get("skills", []),
-                "career": result.payload.get("career", []),
-                "metadata": {k: v for k, v in result.payload.items() 
-                           if k not in ["title", "description", "skills", "career"]}
-            })
-        
-        return formatted_results
+        return [self._format_program(result) for result in results]
     
-    def recommend_courses_for_user(self, user_id: int, program_id: str = None,
-                                  limit: int = 5) -> List[Dict[str, Any]]:
+    def _local_program_index(self) -> Optional[Tuple[List[Any], List[Dict[str, Any]], np.ndarray]]:
         """
-        Рекомендует дисциплины для пользователя на основе его профиля
+        Возвращает локальную копию коллекции программ
         
-        Args:
-            user_id: ID пользователя
-            program_id: ID программы для фильтрации (опционально)
-            limit: Максимальное количество рекомендаций
-            
-        Returns:
-            Список рекомендованных дисциплин с оценками
-        """
-        try:
-            # Получаем эмбеддинг профиля пользователя
-            profile_result = self.client.retrieve(
-                collection_name=self.PROFILES_COLLECTION,
-                ids=[str(user_id)]
-            )
-            
-            if not profile_result:
-                return []
-            
-            profile_embedding = profile_result[0].vector
-            
-            # Ищем похожие дисциплины
-            return self.search_courses(
-                profile_embedding,
-                program_id=program_id,
-                limit=limit
-            )
-        except Exception as e:
-            print(f"Ошибка при поиске рекомендаций: {e}")
-            return []
-    
-    def recommend_programs_for_user(self, user_id: int, 
-                                   limit: int = 5) -> List[Dict[str, Any]]:
-        """
-        Рекомендует программы для пользователя на основе его профиля
+        Копия загружается из Qdrant при первом обращении и перечитывается через
+        LOCAL_INDEX_TTL секунд или после добавления программ. Qdrant остается
+        источником данных. После неудачной загрузки следующая попытка
+        выполняется тоже не раньше чем через LOCAL_INDEX_TTL секунд.
         
-        Args:
-            user_id: ID пользователя
-            limit: Максимальное количество рекомендаций
-            
         Returns:
-            Список рекомендованных программ с оценками
+            Кортеж (ID точек, payload, матрица векторов) или None, если коллекция
+            больше LOCAL_INDEX_MAX_SIZE или не загрузилась
         """
+        now = time.monotonic()
+        with self._program_index_lock:
+            if self._program_index_loaded_at is not None \
+                    and now - self._program_index_loaded_at <= self.LOCAL_INDEX_TTL:
+                return self._program_index
+        
         try:
-            # Получаем эмбеддинг профиля пользователя
-            profile_result = self.client.retrieve(
-                collection_name=self.PROFILES_COLLECTION,
-                ids=[str(user_id)]
-            )
-            
-            if not profile_result:
-                return []
-            
-            profile_embedding = profile_result[0].vector
-            
-            # Ищем похожие программы
-            return self.search_programs(
-                profile_embedding,
-                limit=limit
+            points = []
+            offset = None
+            while True:
+                batch, offset = self.client.scroll(
+                    collection_name=self.PROGRAMS_COLLECTION,
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                points.extend(batch)
+                if len(points) > self.LOCAL_INDEX_MAX_SIZE or offset is None:
+                    break
+        except Exception:
+            logger.exception("Ошибка при загрузке локального индекса программ")
+            # До следующей попытки поиск идет в Qdrant
+            with self._program_index_lock:
+                self._program_index = None
+                self._program_index_loaded_at = now
+            return None
+        
+        index = None
+        if len(points) <= self.LOCAL_INDEX_MAX_SIZE:
+            # Векторы нормализованы, поэтому сходство - скалярное произведение
+            vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+            index = (
+                [point.id for point in points],
+                [point.payload or {} for point in points],
+                vectors.reshape(len(points), self.embedding_dim)
             )
-        except Exception as e:
-            print(f"Ошибка при поиске рекомендаций программ: {e}")
-            return []
+        
+        with self._program_index_lock:
+            self._program_index = index
+            self._program_index_loaded_at = now
+        return index
+    
+    def _invalidate_local_program_index(self):
+        """Сбрасывает локальную копию коллекции программ"""
+        with self._program_index_lock:
+            self._program_index = None
+            self._program_index_loaded_at = None
+    
+    def _search_local_programs(self, local_index: Tuple[List[Any], List[Dict[str, Any]], np.ndarray],
+                               query_embedding: List[float], limit: int,
+                               score_threshold: float,
+                               with_payload: Union[bool, List[str]]) -> List[Dict[str, Any]]:
+        """Ищет программы полным перебором по локальной копии коллекции"""
+        ids, payloads, vectors = local_index
+        results = []
+        for i, score in self.embedding_model.top_k(np.asarray(query_embedding, dtype=np.float32), vectors, limit):
+            if score < score_threshold:
+                break
+            payload = payloads[i]
+            if with_payload is False:
+                payload = None
+            elif with_payload is not True:
+                payload = {key: payload[key] for key in with_payload if key in payload}
+            results.append(self._format_program(
+                ScoredPoint(id=ids[i], version=0, score=score, payload=payload)
+            ))
+        return results
+    
+    @staticmethod
+    def _format_program(result) -> Dict[str, Any]:
+        """Преобразует найденную точку программы в словарь"""
+        payload = result.payload or {}
+        return {
+            "id": result.id,
+            "score": result.score,
+            "program_id": payload.get("program_id"),
+            "title": payload.get("title"),
+            "skills": payload.get("skills", []),
+            "career": payload.get("career", []),
+            "metadata": {k: v for k, v in payload.items() if k not in _PROGRAM_PAYLOAD_KEYS}
+        }
     
     def delete_collection(self, collection_name: str) -> bool:
         """
@@ -405,9 +662,11 @@ class QdrantVectorDB:
         """
         try:
             self.client.delete_collection(collection_name)
+            if collection_name == self.PROGRAMS_COLLECTION:
+                self._invalidate_local_program_index()
             return True
-        except Exception as e:
-            print(f"Ошибка при удалении коллекции: {e}")
+        except Exception:
+            logger.exception("Ошибка при удалении коллекции")
             return False
     
     def get_collection_info(self, collection_name: str) -> Dict[str, Any]:
@@ -428,8 +687,8 @@ class QdrantVectorDB:
                 "vector_size": info.config.params.vectors.size,
                 "distance": info.config.params.vectors.distance
             }
-        except Exception as e:
-            print(f"Ошибка при получении информации о коллекции: {e}")
+        except Exception:
+            logger.exception("Ошибка при получении информации о коллекции")
             return {}
 
 
@@ -438,7 +697,8 @@ _db_instance = None
 
 
 def get_vector_db(url: str = None, api_key: str = None,
-                 embedding_model: EmbeddingModel = None) -> QdrantVectorDB:
+                 embedding_model: EmbeddingModel = None,
+                 hnsw_ef: int = None) -> QdrantVectorDB:
     """
     Получить или создать глобальный экземпляр векторной базы данных
     
@@ -446,11 +706,12 @@ def get_vector_db(url: str = None, api_key: str = None,
         url: URL Qdrant сервера
         api_key: API ключ для Qdrant Cloud
         embedding_model: Модель эмбеддингов
+        hnsw_ef: Параметр ef поиска по HNSW
         
     Returns:
         Экземпляр QdrantVectorDB
     """
     global _db_instance
     if _db_instance is None:
-        _db_instance = QdrantVectorDB(url, api_key, embedding_model)
+        _db_instance = QdrantVectorDB(url, api_key, embedding_model, hnsw_ef)
     return _db_instance
@@ -0,0 +1,200 @@
+"""
+Тесты отложенной записи профилей и перезагрузки каталога (ProgramDatabase)
+
+Вместо MongoDB используются коллекции в памяти с тем же интерфейсом.
+"""
+import pytest
+from pymongo.errors import AutoReconnect
+
+from src.database import ProgramDatabase
+
+
+class FakeProfilesCollection:
+    """Коллекция профилей в памяти: find_one и bulk_write с upsert"""
+
+    def __init__(self):
+        self.docs = {}
+        self.failures = 0  # сколько следующих записей завершится ошибкой
+        self.on_write = None  # вызывается в начале bulk_write (запись "в полете")
+
+    def with_options(self, **kwargs):
+        return self
+
+    def find_one(self, query, projection=None):
+        doc = self.docs.get(query['user_id'])
+        return dict(doc) if doc is not None else None
+
+    def bulk_write(self, operations, ordered=True):
+        if self.on_write is not None:
+            self.on_write()
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection lost")
+        for operation in operations:
+            user_id = operation._filter['user_id']
+            doc = self.docs.get(user_id)
+            if doc is None:
+                doc = self.docs[user_id] = dict(operation._doc.get('$setOnInsert', {}))
+            doc.update(operation._doc.get('$set', {}))
+
+
+class FakeCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+class FakeProgramsCollection:
+    """Коллекция программ в памяти: find по всему каталогу"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.fail = False
+        self.on_find = None  # вызывается во время чтения каталога
+        self.find_calls = 0
+
+    def find(self, query=None, projection=None):
+        self.find_calls += 1
+        if self.on_find is not None:
+            self.on_find()
+        if self.fail:
+            raise AutoReconnect("connection lost")
+        return FakeCursor(dict(doc) for doc in self.docs)
+
+
+def program_doc(program_id, course_name, skills=()):
+    return {
+        'id': program_id,
+        'title': program_id.upper(),
+        'courses': [{'name': course_name, 'type': 'выборная', 'description': ''}],
+        'skills': list(skills)
+    }
+
+
+@pytest.fixture
+def profiles():
+    return FakeProfilesCollection()
+
+
+@pytest.fixture
+def programs():
+    return FakeProgramsCollection([program_doc('ai', 'Машинное обучение', ['Python'])])
+
+
+@pytest.fixture
+def db(profiles, programs):
+    database = ProgramDatabase('mongodb://localhost:27017/test_db')
+    database._user_profiles_collection = profiles
+    database._programs_collection = programs
+    # Таймер отложенной записи не должен срабатывать во время теста
+    database.PROFILE_FLUSH_DELAY = 3600
+    yield database
+    if database._flush_timer is not None:
+        database._flush_timer.cancel()
+
+
+def test_flush_writes_pending_profiles(db, profiles):
+    db.update_user_profile(1, {'goals': ['ML Engineer']}, create_defaults={'preferred_program': ''})
+    db.flush_user_profiles()
+
+    assert profiles.docs[1] == {'user_id': 1, 'preferred_program': '', 'goals': ['ML Engineer']}
+    assert db._pending_profiles == {}
+    assert db._inflight_profiles == {}
+
+
+def test_failed_flush_requeues_updates_and_rearms_timer(db, profiles):
+    db.update_user_profile(1, {'goals': ['ML Engineer']}, create_defaults={'preferred_program': ''})
+    profiles.failures = 1
+    db.flush_user_profiles()
+
+    assert profiles.docs == {}
+    assert db._pending_profiles == {1: {'goals': ['ML Engineer']}}
+    assert db._pending_profile_defaults == {1: {'preferred_program': ''}}
+    assert db._flush_timer is not None
+
+    # Повторная попытка записывает возвращенные в очередь изменения
+    db.flush_user_profiles()
+    assert profiles.docs[1]['goals'] == ['ML Engineer']
+    assert db._pending_profiles == {}
+
+
+def test_failed_flush_keeps_newer_updates(db, profiles):
+    db.update_user_profile(1, {'background': ['Физик'], 'goals': ['Analyst']})
+
+    # Пока запись "в полете", пользователь меняет цели
+    profiles.on_write = lambda: db.update_user_profile(1, {'goals': ['ML Engineer']})
+    profiles.failures = 1
+    db.flush_user_profiles()
+
+    assert db._pending_profiles[1] == {'background': ['Физик'], 'goals': ['ML Engineer']}
+
+    profiles.on_write = None
+    db.flush_user_profiles()
+    assert profiles.docs[1]['goals'] == ['ML Engineer']
+    assert profiles.docs[1]['background'] == ['Физик']
+
+
+def test_inflight_updates_overlay_reads(db, profiles):
+    profiles.docs[1] = {'user_id': 1, 'goals': ['Analyst']}
+    db.update_user_profile(1, {'goals': ['ML Engineer']})
+
+    seen = []
+
+    def read_during_write():
+        # Промах кэша во время записи: документ в MongoDB еще старый
+        db._profile_cache.clear()
+        seen.append(db.get_user_profile(1))
+
+    profiles.on_write = read_during_write
+    db.flush_user_profiles()
+
+    assert seen[0]['goals'] == ['ML Engineer']
+    assert db.get_user_profile(1)['goals'] == ['ML Engineer']
+
+
+def test_refresh_cache_replaces_catalog_and_derived_caches(db, programs):
+    assert [p.id for p in db.get_all_programs()] == ['ai']
+    assert [c.name for c in db.search_courses('машинное')] == ['Машинное обучение']
+
+    programs.docs = [program_doc('ai', 'Глубокое обучение'), program_doc('ai_product', 'Продуктовая аналитика')]
+    assert db.refresh_cache()
+
+    assert [p.id for p in db.get_all_programs()] == ['ai', 'ai_product']
+    assert db.search_courses('машинное') == []
+    assert [c.name for c in db.search_courses('глубокое')] == ['Глубокое обучение']
+
+
+def test_readers_see_previous_catalog_during_reload(db, programs):
+    previous = db.get_all_programs()
+
+    seen = []
+    programs.on_find = lambda: seen.append((db.get_all_programs(), db.get_program('ai')))
+    programs.docs = [program_doc('ai', 'Глубокое обучение')]
+    find_calls = programs.find_calls
+    assert db.refresh_cache()
+
+    # Во время загрузки читатели получают прежний каталог и не запускают вторую загрузку
+    assert seen == [(previous, previous[0])]
+    assert programs.find_calls == find_calls + 1
+
+
+def test_failed_reload_keeps_previous_catalog(db, programs):
+    previous = db.get_all_programs()
+    db.search_courses('машинное')
+
+    programs.fail = True
+    assert not db.refresh_cache()
+
+    assert db.get_all_programs() is previous
+    assert [c.name for c in db.search_courses('машинное')] == ['Машинное обучение']
+
+
+def test_reload_resets_skill_vocabulary(db, programs):
+    programs.docs.append(program_doc('ai_product', 'Продуктовая аналитика', ['Python', 'SQL']))
+    db.refresh_cache()
+    db.compare_programs('ai', 'ai_product')
+    assert set(db._skill_vocabulary[0]) == {'Python', 'SQL'}
+
+    programs.docs = [program_doc('ai', 'Машинное обучение', ['Go']), program_doc('ai_product', 'Аналитика', ['Go'])]
+    db.refresh_cache()
+    assert "Общие навыки: Go" in db.compare_programs('ai', 'ai_product')
+    assert set(db._skill_vocabulary[0]) == {'Go'}
@@ -0,0 +1,44 @@
+"""
+Тесты определения намерения пользователя (RelevanceFilter.extract_intent)
+"""
+import pytest
+
+from src.dialog_system import RelevanceFilter
+
+
+@pytest.fixture
+def relevance_filter():
+    return RelevanceFilter()
+
+
+@pytest.mark.parametrize("question", [
+    "Посоветуй программу",
+    "Порекомендуй курсы по машинному обучению",
+    # Раньше классифицировались как search и info
+    "Как выбрать курс?",
+    "Что выбрать: AI или AI Product?",
+])
+def test_recommend_intent(relevance_filter, question):
+    assert relevance_filter.extract_intent(question) == 'recommend'
+
+
+@pytest.mark.parametrize("question", [
+    "Чем отличается AI от AI Product?",
+    "Какая программа лучше для аналитика?",
+    # Сравнение приоритетнее рекомендации
+    "Посоветуй, что лучше: AI или AI Product",
+])
+def test_compare_intent(relevance_filter, question):
+    assert relevance_filter.extract_intent(question) == 'compare'
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("Сколько стоит обучение?", 'search'),
+    ("Когда начинается прием документов?", 'search'),
+    ("Где проходят занятия?", 'search'),
+    ("Расскажи о программе", 'info'),
+    ("Кто преподает на программе?", 'info'),
+    ("Привет", 'other'),
+])
+def test_faq_intent(relevance_filter, question, intent):
+    assert relevance_filter.extract_intent(question) == intent